@@ -0,0 +1,13 @@
+import sys
+
+from src.cli import main as cli_main
+
+
+def main():
+    # Benchmark the small and medium sizes, failing on stages more than 25% slower than the baseline
+    # (see 'python main.py bench --help')
+    return cli_main(['bench', '--sizes', 'small', 'medium', '--repeat', '3'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,3 @@
+# src/bench/__init__.py
+from .synthetic import synthetic_scene, write_synthetic_colmap, write_synthetic_splats
+from .benchmark import Benchmark, BENCHMARK_SIZES, compare_cell_exports, save_results, load_results, compare_results
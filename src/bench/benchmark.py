@@ -0,0 +1,322 @@
+import contextlib
+import filecmp
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from src.bench.synthetic import SYNTHETIC_VERSION, write_synthetic_colmap, write_synthetic_splats
+from src.common.cell_manifest import CellManifest, GROUND_AXES
+from src.common.colmap_loader import COLMAPLoader
+from src.common.instrumentation import RSSSampler
+from src.common.visualization import SceneVisualizer
+from src.merge.splat_loader import SplatLoader
+from src.merge.splat_merger import SplatMerger
+from src.projection.ground_plane_projection import GroundPlaneProjector
+from src.splitter.cell_shards import CellShards
+from src.splitter.export_pipeline import ExportPipeline
+from src.splitter.scene_exporter import SceneExporter
+from src.splitter.scene_splitter import SceneSplitter
+
+# Benchmark sizes: synthetic scene and splat parameters
+BENCHMARK_SIZES = {
+    'small': {'points': 100_000, 'images': 100, 'track_length': 4, 'grid': (4, 4), 'splats_per_cell': 20_000,
+              'sh_degree': 3},
+    'medium': {'points': 1_000_000, 'images': 400, 'track_length': 5, 'grid': (8, 8), 'splats_per_cell': 50_000,
+               'sh_degree': 3},
+    'large': {'points': 10_000_000, 'images': 1600, 'track_length': 6, 'grid': (16, 16),
+              'splats_per_cell': 100_000, 'sh_degree': 3}
+}
+
+# Version of the results file layout
+RESULTS_VERSION = 2
+
+
+class Benchmark:
+    def __init__(self, work_dir: str, sizes=('small',), repeat: int = 1, seed: int = 0):
+        """
+        Initializes the Benchmark, which times every pipeline stage on synthetic data of several sizes.
+
+        :param work_dir: str
+            Directory of the generated data and of the stages' outputs. Generated data is kept between runs and only
+            regenerated when its parameters change.
+        :param sizes: iterable
+            Names of BENCHMARK_SIZES entries, or (name, parameters) pairs for custom sizes.
+        :param repeat: int
+            Number of timed runs of every stage; the fastest one is kept.
+        :param seed: int
+            Seed of the synthetic data.
+        """
+        self.work_dir = work_dir
+        self.sizes = [(size, BENCHMARK_SIZES[size]) if isinstance(size, str) else tuple(size) for size in sizes]
+        self.repeat = repeat
+        self.seed = seed
+
+    def prepare(self, name: str, params: dict):
+        """
+        Generates the synthetic COLMAP scene and cell .ply files of a size, unless they already exist.
+
+        :param name: str
+            The name of the size.
+        :param params: dict
+            The parameters of the size (see BENCHMARK_SIZES).
+        :return: tuple
+            The COLMAP directory, the .ply directory and the cell boundaries.
+        """
+        data_dir = os.path.join(self.work_dir, name, 'data')
+        colmap_dir = os.path.join(data_dir, 'colmap')
+        splats_dir = os.path.join(data_dir, 'splats')
+        params_path = os.path.join(data_dir, 'params.json')
+        stamp = {'params': {**params, 'grid': list(params['grid'])}, 'seed': self.seed, 'version': SYNTHETIC_VERSION}
+
+        cells_path = os.path.join(data_dir, 'cells.json')
+        try:
+            with open(params_path, 'r') as params_file:
+                if json.load(params_file) == stamp:
+                    return colmap_dir, splats_dir, SplatLoader.load_cells(cells_path)
+        except (OSError, ValueError):
+            pass
+
+        print(f"Generating the '{name}' benchmark data in {data_dir}")
+        shutil.rmtree(data_dir, ignore_errors=True)
+        rows, cols = params['grid']
+        with contextlib.redirect_stdout(io.StringIO()):
+            write_synthetic_colmap(colmap_dir, params['points'], params['images'], params['track_length'], self.seed)
+            cells = write_synthetic_splats(splats_dir, rows, cols, params['splats_per_cell'], params['sh_degree'],
+                                           seed=self.seed)
+
+        CellManifest(cells=cells).save(cells_path)
+        with open(params_path, 'w') as params_file:
+            json.dump(stamp, params_file)
+
+        return colmap_dir, splats_dir, cells
+
+    def _time(self, stage: str, run):
+        """
+        Times a stage, keeping the fastest of the repeated runs. The stage's own output is silenced.
+
+        :return: tuple
+            The best time in seconds, the largest peak RSS growth of the runs in bytes (see RSSSampler.peak) and the
+            value returned by the last run.
+        """
+        best = None
+        memory = 0
+        value = None
+        for _ in range(self.repeat):
+            # Drop the previous run's value first, so its memory is not counted as the baseline of this one
+            value = None
+            with contextlib.redirect_stdout(io.StringIO()), RSSSampler() as sampler:
+                start = time.perf_counter()
+                value = run()
+                elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            memory = max(memory, sampler.peak)
+        print(f"  {stage}: {best:.3f} s, {memory / 2 ** 20:.1f} MiB")
+        return best, memory, value
+
+    def run_size(self, name: str, params: dict):
+        """
+        Runs every stage on one size: load, split, export and plot on the COLMAP scene, a streaming split spilled to
+        shards and exported with the per-cell plots, then cull and merge on the cell .ply files.
+
+        The COLMAP files of the streaming split must be byte-identical to those of the in-memory split.
+
+        :param name: str
+            The name of the size.
+        :param params: dict
+            The parameters of the size.
+        :return: list
+            One result per stage, with its time, throughput (items per second) and the peak growth of the process's
+            RSS while the stage ran (bytes), sampled on Linux only.
+        """
+        colmap_dir, splats_dir, cells = self.prepare(name, params)
+        output_dir = os.path.join(self.work_dir, name, 'output')
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.makedirs(output_dir)
+        rows, cols = params['grid']
+        num_splats = rows * cols * params['splats_per_cell']
+
+        print(f"Benchmark '{name}': {params['points']} points, {num_splats} splats")
+        results = []
+
+        def record(stage, seconds, memory, items):
+            results.append({
+                'size': name,
+                'stage': stage,
+                'seconds': seconds,
+                'items': items,
+                'throughput': items / seconds if seconds > 0 else None,
+                'stage_rss': memory
+            })
+
+        # COLMAP stages
+        seconds, memory, (num_points, _, scene) = self._time(
+            'load', lambda: COLMAPLoader(colmap_dir, use_cache=False).load_scene_columnar())
+        record('load', seconds, memory, num_points)
+
+        seconds, memory, (_, split_scenes) = self._time(
+            'split', lambda: SceneSplitter(scene, rows, cols, num_points).split_scene())
+        record('split', seconds, memory, num_points)
+
+        def export():
+            for (row, col), cell_scene in split_scenes:
+                SceneExporter(cell_scene, os.path.join(output_dir, 'cells', f"{row}_{col}")).export_scene()
+        seconds, memory, _ = self._time('export', export)
+        record('export', seconds, memory, num_points)
+
+        def split_stream():
+            loader = COLMAPLoader(colmap_dir, use_cache=False)
+            _, images = loader.load_images_columnar()
+            _, intrinsics = loader.load_cameras_columnar()
+            shards = CellShards(os.path.join(output_dir, 'shards'))
+            try:
+                ss = SceneSplitter(None, rows, cols, 0)
+                stream_cells, split_cells = ss.split_stream(loader.iter_points3D, images, shards)
+                pipeline = ExportPipeline(os.path.join(output_dir, 'stream'), os.path.join(output_dir, 'stream', '2d_'),
+                                          workers=1)
+                pipeline.run_spilled(stream_cells, split_cells, shards, images, intrinsics, ss.grid_parameters())
+            finally:
+                shards.cleanup()
+        seconds, memory, _ = self._time('stream', split_stream)
+        record('stream', seconds, memory, num_points)
+
+        mismatches = compare_cell_exports(os.path.join(output_dir, 'cells'), os.path.join(output_dir, 'stream'))
+        if mismatches:
+            raise ValueError(f"The streaming split differs from the in-memory split: {', '.join(mismatches)}")
+
+        def plot():
+            projected_scene = GroundPlaneProjector(scene).project_to_2d()
+            SceneVisualizer(projected_scene).plot_scene2D(os.path.join(output_dir, 'scene2d.png'))
+        seconds, memory, _ = self._time('plot', plot)
+        record('plot', seconds, memory, num_points)
+
+        # Splat stages
+        sl = SplatLoader(splats_dir)
+        seconds, memory, _ = self._time(
+            'cull', lambda: SplatMerger(sl.load_splats_columnar(), cells, axes=GROUND_AXES).cull_gaussians())
+        record('cull', seconds, memory, num_splats)
+
+        seconds, memory, _ = self._time(
+            'merge', lambda: SplatMerger(sl.list_splat_files(), cells, axes=GROUND_AXES).merge_splats_streaming(
+                os.path.join(output_dir, 'merged.ply')))
+        record('merge', seconds, memory, num_splats)
+
+        return results
+
+    def run(self):
+        """
+        Runs the benchmark on every size.
+
+        :return: dict
+            The results, with metadata about the machine and library versions.
+        """
+        results = []
+        for name, params in self.sizes:
+            results += self.run_size(name, params)
+
+        return {
+            'version': RESULTS_VERSION,
+            'started': time.time(),
+            'machine': {
+                'python': sys.version.split()[0],
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'cpus': os.cpu_count()
+            },
+            'repeat': self.repeat,
+            'sizes': {name: {**params, 'grid': list(params['grid'])} for name, params in self.sizes},
+            'results': results
+        }
+
+
+def compare_cell_exports(cells_dir: str, pipeline_dir: str):
+    """
+    Compares the COLMAP files of cells exported directly by SceneExporter with those of the same cells exported by an
+    ExportPipeline, byte for byte.
+
+    :param cells_dir: str
+        Directory holding one "row_col" directory of COLMAP files per cell.
+    :param pipeline_dir: str
+        Output directory of the ExportPipeline, holding "row_col/colmap/sparse/0" per cell.
+    :return: list
+        The cell directories or files that are missing on either side or differ, relative to cells_dir.
+    """
+    cell_names = set(os.listdir(cells_dir))
+    pipeline_names = {name for name in os.listdir(pipeline_dir) if os.path.isdir(os.path.join(pipeline_dir, name))}
+
+    mismatches = sorted(cell_names ^ pipeline_names)
+    for cell_name in sorted(cell_names & pipeline_names):
+        cell_dir = os.path.join(cells_dir, cell_name)
+        exported_dir = os.path.join(pipeline_dir, cell_name, 'colmap', 'sparse', '0')
+        for file_name in sorted(os.listdir(cell_dir)):
+            exported_path = os.path.join(exported_dir, file_name)
+            if not os.path.exists(exported_path) or \
+                    not filecmp.cmp(os.path.join(cell_dir, file_name), exported_path, shallow=False):
+                mismatches.append(os.path.join(cell_name, file_name))
+
+    return mismatches
+
+
+def save_results(results: dict, path: str):
+    """
+    Writes benchmark results as JSON.
+
+    :param results: dict
+        The results returned by Benchmark.run.
+    :param path: str
+        Path of the results file.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f"Benchmark results written to {path}")
+
+
+def load_results(path: str):
+    """
+    Reads benchmark results written by save_results.
+
+    :param path: str
+        Path of the results file.
+    :return: dict
+    """
+    with open(path, 'r') as results_file:
+        return json.load(results_file)
+
+
+def compare_results(results: dict, baseline: dict, tolerance: float = 0.25):
+    """
+    Compares benchmark results against a baseline and prints every stage's change.
+
+    :param results: dict
+        The current results.
+    :param baseline: dict
+        The baseline results.
+    :param tolerance: float
+        Relative slowdown beyond which a stage counts as a regression (0.25 = 25% slower).
+    :return: list
+        The regressions, as (size, stage, baseline seconds, current seconds) tuples.
+    """
+    baseline_seconds = {(entry['size'], entry['stage']): entry['seconds'] for entry in baseline['results']}
+
+    regressions = []
+    for entry in results['results']:
+        key = (entry['size'], entry['stage'])
+        if key not in baseline_seconds:
+            continue
+
+        before = baseline_seconds[key]
+        ratio = entry['seconds'] / before if before > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append((entry['size'], entry['stage'], before, entry['seconds']))
+            flag = '  REGRESSION'
+        print(f"{entry['size']:>8} {entry['stage']:>8}: {before:.3f} s -> {entry['seconds']:.3f} s "
+              f"({ratio:.2f}x){flag}")
+
+    return regressions
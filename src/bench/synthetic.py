@@ -0,0 +1,172 @@
+import os
+
+import numpy as np
+
+from src.common.scene import Scene
+from src.merge.ply_schema import PlySchema
+from src.merge.splat_exporter import SplatExporter
+from src.splitter.scene_exporter import SceneExporter
+
+# Side of the square ground area covered by synthetic scenes, in scene units
+SCENE_EXTENT = 100.0
+
+# Version of the synthetic data layout; bump it so existing benchmark data is generated again
+SYNTHETIC_VERSION = 2
+
+
+def synthetic_scene(num_points: int, num_images: int, track_length: float = 4.0, seed: int = 0):
+    """
+    Generates a synthetic COLMAP scene laid out like an aerial capture of a large area.
+
+    Points cover a SCENE_EXTENT x SCENE_EXTENT ground area (X/Z) with some relief (Y). Images sit on a regular grid
+    above it, and every point is observed by a Poisson-distributed number of images near it (at least two), so
+    splitting yields realistic per-cell camera sets. Every column of the image grid has its own camera intrinsics,
+    so cells use different subsets of the cameras.
+
+    :param num_points: int
+        Number of 3D points.
+    :param num_images: int
+        Approximate number of images; the exact count is the closest square grid.
+    :param track_length: float
+        Mean number of observations per point.
+    :param seed: int
+        Seed of the generator, so the same parameters always give the same scene.
+    :return: Scene
+    """
+    rng = np.random.default_rng(seed)
+
+    # Points: a ground area with some relief
+    xyz = np.empty((num_points, 3))
+    xyz[:, 0] = rng.uniform(0, SCENE_EXTENT, num_points)
+    xyz[:, 2] = rng.uniform(0, SCENE_EXTENT, num_points)
+    xyz[:, 1] = 2 * np.sin(xyz[:, 0] / 7) * np.cos(xyz[:, 2] / 11) + rng.normal(0, 0.2, num_points)
+
+    # Images: a regular grid of camera positions above the ground
+    side = max(int(round(np.sqrt(num_images))), 1)
+    num_images = side * side
+    grid_x, grid_z = np.meshgrid(np.arange(side), np.arange(side), indexing='ij')
+    spacing = SCENE_EXTENT / side
+    tvec = np.column_stack(((grid_x.ravel() + 0.5) * spacing, np.full(num_images, 30.0),
+                            (grid_z.ravel() + 0.5) * spacing))
+    qvec = np.tile([1.0, 0.0, 0.0, 0.0], (num_images, 1))
+
+    # Tracks: every point is observed by images within two grid steps of it
+    track_lengths = np.maximum(rng.poisson(track_length, num_points), 2)
+    track_offsets = np.zeros(num_points + 1, dtype=np.int64)
+    np.cumsum(track_lengths, out=track_offsets[1:])
+    track_points = np.repeat(np.arange(num_points), track_lengths)
+    nearest = np.clip((xyz[:, [0, 2]] / spacing).astype(np.int64), 0, side - 1)
+    near_x = np.clip(nearest[track_points, 0] + rng.integers(-2, 3, len(track_points)), 0, side - 1)
+    near_z = np.clip(nearest[track_points, 1] + rng.integers(-2, 3, len(track_points)), 0, side - 1)
+    track_image_rows = near_x * side + near_z
+
+    # 2D points: the observations of every image, numbered in point order
+    order = np.argsort(track_image_rows, kind='stable')
+    image_num_points = np.bincount(track_image_rows, minlength=num_images)
+    point2d_offsets = np.zeros(num_images + 1, dtype=np.int64)
+    np.cumsum(image_num_points, out=point2d_offsets[1:])
+    track_point2d_idxs = np.empty(len(track_points), dtype=np.uint32)
+    track_point2d_idxs[order] = np.arange(len(track_points)) - point2d_offsets[track_image_rows[order]]
+
+    point_ids = np.arange(1, num_points + 1, dtype=np.uint64)
+    points = {
+        "ids": point_ids,
+        "xyz": xyz,
+        "rgb": rng.integers(0, 256, (num_points, 3), dtype=np.uint8),
+        "error": rng.gamma(2.0, 0.4, num_points),
+        "track_offsets": track_offsets,
+        "track_image_ids": (track_image_rows + 1).astype(np.uint32),
+        "track_point2d_idxs": track_point2d_idxs
+    }
+    images = {
+        "ids": np.arange(1, num_images + 1, dtype=np.uint32),
+        "qvec": qvec,
+        "tvec": tvec,
+        "camera_id": (grid_x.ravel() + 1).astype(np.uint32),
+        "name": [f"image_{i:06d}.jpg" for i in range(1, num_images + 1)],
+        "point2d_offsets": point2d_offsets,
+        "xys": rng.uniform(0, 1000, (len(track_points), 2)),
+        "point3d_ids": point_ids[track_points[order]].astype(np.int64)
+    }
+    focal_lengths = 800.0 + np.arange(side)
+    intrinsics = {
+        "ids": np.arange(1, side + 1, dtype=np.int32),
+        "model_id": np.ones(side, dtype=np.int32),  # PINHOLE
+        "width": np.full(side, 1000, dtype=np.uint64),
+        "height": np.full(side, 1000, dtype=np.uint64),
+        "params": np.column_stack((focal_lengths, focal_lengths, np.full(side, 500.0), np.full(side, 500.0),
+                                   np.zeros((side, 8)))),
+        "num_params": np.full(side, 4, dtype=np.int64)
+    }
+
+    return Scene(points, images, intrinsics)
+
+
+def write_synthetic_colmap(output_dir: str, num_points: int, num_images: int, track_length: float = 4.0,
+                           seed: int = 0):
+    """
+    Writes a synthetic scene (see synthetic_scene) as COLMAP 'points3D.bin', 'images.bin' and 'cameras.bin' files.
+
+    :param output_dir: str
+        Directory of the COLMAP files.
+    :return: Scene
+        The generated scene.
+    """
+    scene = synthetic_scene(num_points, num_images, track_length, seed)
+    SceneExporter(scene, output_dir).export_scene()
+    return scene
+
+
+def write_synthetic_splats(output_dir: str, rows: int, cols: int, splats_per_cell: int, sh_degree: int = 3,
+                           overlap: float = 0.2, seed: int = 0):
+    """
+    Writes one synthetic Gaussian Splatting .ply file per cell of a rows x cols grid over the synthetic scene area,
+    named after the cell ("row_col.ply") like the split scenes' results.
+
+    Gaussians of a cell spread past its boundaries on the X/Z plane, as trained cells do, so merging has to cull them.
+
+    :param output_dir: str
+        Directory of the .ply files.
+    :param rows: int
+        Number of rows of the cell grid (along Z).
+    :param cols: int
+        Number of columns of the cell grid (along X).
+    :param splats_per_cell: int
+        Number of Gaussians of every cell.
+    :param sh_degree: int
+        Degree of the spherical harmonics of the Gaussians.
+    :param overlap: float
+        Fraction of the cell size the Gaussians spread past each boundary.
+    :param seed: int
+        Seed of the generator.
+    :return: dict
+        The cell boundaries keyed by (row, col), as returned by SplatLoader.load_cells.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    dtype = PlySchema.gaussian(sh_degree).dtype
+    cell_width = SCENE_EXTENT / cols
+    cell_depth = SCENE_EXTENT / rows
+
+    cells = {}
+    for row in range(rows):
+        for col in range(cols):
+            cell = {
+                'min': [col * cell_width, SCENE_EXTENT - (row + 1) * cell_depth],
+                'max': [(col + 1) * cell_width, SCENE_EXTENT - row * cell_depth]
+            }
+            cells[(row, col)] = cell
+
+            # Random attributes, then positions spread around the cell
+            vertices = np.empty(splats_per_cell, dtype=dtype)
+            values = vertices.view(np.float32).reshape(splats_per_cell, -1)
+            values[:] = rng.normal(0, 1, values.shape)
+            values[:, 0] = rng.uniform(cell['min'][0] - overlap * cell_width, cell['max'][0] + overlap * cell_width,
+                                       splats_per_cell)
+            values[:, 1] = rng.normal(0, 2, splats_per_cell)
+            values[:, 2] = rng.uniform(cell['min'][1] - overlap * cell_depth, cell['max'][1] + overlap * cell_depth,
+                                       splats_per_cell)
+
+            SplatExporter(vertices, os.path.join(output_dir, f"{row}_{col}.ply")).export_splat()
+
+    return cells
@@ -0,0 +1,359 @@
+import argparse
+import functools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from src.bench.benchmark import Benchmark, BENCHMARK_SIZES, save_results, load_results, compare_results
+from src.common.cell_manifest import CellManifest
+from src.common.colmap_loader import COLMAPLoader, POINT_BATCH_SIZE
+from src.common.instrumentation import enable_instrumentation, stage
+from src.common.subsampling import SUBSAMPLING_STRATEGIES, PREVIEW_POINTS
+from src.common.visualization import SceneVisualizer
+from src.merge.splat_exporter import SplatExporter
+from src.merge.splat_loader import SplatLoader
+from src.merge.splat_merger import SplatMerger
+from src.projection.ground_plane_projection import GroundPlaneProjector
+from src.splitter.cell_shards import CellShards
+from src.splitter.export_pipeline import ExportPipeline
+from src.splitter.scene_splitter import SceneSplitter
+
+# Default locations of every dataset's files; '{dataset}' is replaced by the dataset name
+INPUT_PATTERN = 'data/input/{dataset}/train/sparse/0'
+OUTPUT_PATTERN = 'data/output/{dataset}'
+SPLATS_PATTERN = 'splats/{dataset}/split'
+MERGED_PATTERN = 'splats/{dataset}/full/{dataset}.ply'
+
+
+def project_scene(dataset: str, scene, loader: COLMAPLoader, output_dir: str, budget: int, strategy: str,
+                  cells=None):
+    """
+    Plots a loaded scene projected on the ground plane (every point, as a density raster) and in 3D (a
+    fixed-budget preview of its points).
+
+    :param dataset: str
+        The dataset name, used as the prefix of the plot files.
+    :param scene: Scene
+        The scene returned by loader.load_scene_columnar.
+    :param loader: COLMAPLoader
+        The loader of the scene, caching the preview.
+    :param output_dir: str
+        Directory of the plot files.
+    :param budget: int
+        Maximum number of points of the 3D preview.
+    :param strategy: str
+        The subsampling strategy of the 3D preview.
+    :param cells: list
+        Optional grid of cells of a split of the scene, drawn on top of the 2D plot.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Visualize the scene projected in 2D
+    sv2d = SceneVisualizer(scene=GroundPlaneProjector(scene=scene).project_to_2d())
+    sv2d.plot_scene2D(os.path.join(output_dir, dataset + '2d.png'), cells=cells)
+
+    # Visualize the scene in 3D from the preview
+    _, _, preview = loader.load_preview(budget=budget, strategy=strategy, scene=scene)
+    sv3d = SceneVisualizer(scene=preview)
+    sv3d.plot_scene3D(os.path.join(output_dir, dataset + '3d.png'))
+
+
+def split_dataset(dataset: str, args):
+    """
+    Splits a dataset: loads its COLMAP scene once, splits it, plots its overview and exports every cell with the cell
+    manifest. With --project, the projection plots are drawn from the same loaded scene.
+
+    :param dataset: str
+        The dataset name.
+    :param args: argparse.Namespace
+        The parsed 'split' options.
+    :return: str
+        The output directory of the dataset.
+    """
+    if args.stream:
+        return split_dataset_stream(dataset, args)
+
+    output_dir = args.output.format(dataset=dataset)
+    os.makedirs(output_dir, exist_ok=True)
+    instrumentation = enable_instrumentation()
+
+    # Load COLMAP scene
+    cl = COLMAPLoader(path_to_scene=args.input.format(dataset=dataset), use_cache=args.cache)
+    num_of_points, num_of_cameras, scene = cl.load_scene_columnar()
+
+    # Split complete scene
+    ss = SceneSplitter(scene, args.rows, args.cols, num_of_points, args.max_points, args.max_cameras,
+                       margin=args.margin)
+    cells, split_scenes = ss.split_scene()
+
+    # Plot the density of the complete scene with the cell grid on top, along with the 3D preview with --project
+    if args.project:
+        project_scene(dataset, scene, cl, output_dir, args.budget, args.strategy, cells=cells)
+    else:
+        sv = SceneVisualizer(GroundPlaneProjector(scene).project_to_2d())
+        sv.plot_scene2D(os.path.join(output_dir, dataset + '2d.png'), cells=cells)
+
+    # Export, project and plot every cell in parallel, then write the cell manifest
+    pipeline = ExportPipeline(output_dir, os.path.join(output_dir, dataset + '2d_'), args.workers, args.incremental)
+    pipeline.run(cells, split_scenes, ss.grid_parameters(), cl.source_fingerprints())
+
+    # Write the run report
+    instrumentation.save_report(os.path.join(output_dir, 'split_report.json'))
+    return output_dir
+
+
+def split_dataset_stream(dataset: str, args):
+    """
+    Splits a dataset too large to hold: its points are read in batches and spilled to per-cell shards on disk, then
+    every cell's COLMAP files are written from its shards, so memory stays bounded by a batch plus a few cells. The
+    overview and projection plots, which need every point, are not drawn.
+
+    :param dataset: str
+        The dataset name.
+    :param args: argparse.Namespace
+        The parsed 'split' options.
+    :return: str
+        The output directory of the dataset.
+    """
+    output_dir = args.output.format(dataset=dataset)
+    os.makedirs(output_dir, exist_ok=True)
+    instrumentation = enable_instrumentation()
+
+    # Load the cameras only; the points are read in batches
+    path = args.input.format(dataset=dataset)
+    cl = COLMAPLoader(path_to_scene=path, use_cache=args.cache)
+    with stage('load'):
+        _, images = cl.load_images_columnar()
+        intrinsics = None
+        if os.path.exists(os.path.join(path, 'cameras.bin')):
+            _, intrinsics = cl.load_cameras_columnar()
+
+    # Split the scene, spilling every batch of binned points to the cells' shards
+    spill_dir = args.spill_dir.format(dataset=dataset) if args.spill_dir else os.path.join(output_dir, '.shards')
+    shards = CellShards(spill_dir)
+    try:
+        ss = SceneSplitter(None, args.rows, args.cols, 0, margin=args.margin)
+        cells, split_cells = ss.split_stream(functools.partial(cl.iter_points3D, args.batch_size), images, shards)
+
+        # Write every cell's COLMAP files from its shards, then the cell manifest
+        pipeline = ExportPipeline(output_dir, os.path.join(output_dir, dataset + '2d_'), args.workers,
+                                  args.incremental)
+        pipeline.run_spilled(cells, split_cells, shards, images, intrinsics, ss.grid_parameters(),
+                             cl.source_fingerprints())
+    finally:
+        shards.cleanup()
+
+    # Write the run report
+    instrumentation.save_report(os.path.join(output_dir, 'split_report.json'))
+    return output_dir
+
+
+def project_dataset(dataset: str, args):
+    """
+    Plots a dataset projected on the ground plane and in 3D (see project_scene).
+
+    :param dataset: str
+        The dataset name.
+    :param args: argparse.Namespace
+        The parsed 'project' options.
+    :return: str
+        The directory of the plots.
+    """
+    cl = COLMAPLoader(path_to_scene=args.input.format(dataset=dataset), use_cache=args.cache)
+    _, _, scene = cl.load_scene_columnar()
+
+    output_dir = args.output.format(dataset=dataset)
+    project_scene(dataset, scene, cl, output_dir, args.budget, args.strategy)
+    return output_dir
+
+
+def merge_dataset(dataset: str, args):
+    """
+    Merges the trained cells of a dataset into a single .ply file, culling every cell to its boundaries.
+
+    :param dataset: str
+        The dataset name.
+    :param args: argparse.Namespace
+        The parsed 'merge' options.
+    :return: str
+        The path of the merged .ply file.
+    """
+    output_path = args.output.format(dataset=dataset)
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    instrumentation = enable_instrumentation()
+
+    # Load cell boundaries information from the cell manifest, culling on the axes it was split on
+    sl = SplatLoader(args.splats.format(dataset=dataset))
+    manifest = CellManifest.load(args.cells.format(dataset=dataset))
+    cells = manifest.boundaries()
+    axes = tuple(args.axes) if args.axes is not None else manifest.axes()
+
+    if args.incremental:
+        # Rebuild the output from the cached cells plus the changed ones
+        sm = SplatMerger(sl.list_splat_files(), cells, axes=axes)
+        sm.merge_splats_incremental(output_path, os.path.join(os.path.dirname(output_path), '.merge_cache'))
+    elif args.stream:
+        # Cull and write one cell at a time
+        sm = SplatMerger(sl.list_splat_files(), cells, axes=axes)
+        sm.merge_splats_streaming(output_path)
+    else:
+        # Load and cull split scenes' GS results concurrently, then merge and export them
+        splats = sl.load_splats_parallel(workers=args.workers, cells=cells, axes=axes)
+        sm = SplatMerger(splats, cells, axes=axes)
+        SplatExporter(sm.merge_splats(culled=True), output_path).export_splat()
+
+    # Write the run report
+    instrumentation.save_report(os.path.join(os.path.dirname(output_path), 'merge_report.json'))
+    return output_path
+
+
+def run_datasets(task, datasets, args):
+    """
+    Runs a task on every dataset, at most args.jobs of them at a time in separate processes, so each dataset keeps
+    its own scene and run report.
+
+    :param task: callable
+        The task, called with a dataset name and args; it must be a module-level function.
+    :param datasets: list
+        The dataset names.
+    :param args: argparse.Namespace
+        The parsed options.
+    :return: list
+        The results of the task, in dataset order.
+    """
+    jobs = min(args.jobs, len(datasets))
+    if jobs <= 1:
+        return [task(dataset, args) for dataset in datasets]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(task, dataset, args) for dataset in datasets]
+        return [future.result() for future in futures]
+
+
+def run_bench(args):
+    """
+    Runs the benchmark suite, saves its results and compares them against the baseline, if any.
+
+    :param args: argparse.Namespace
+        The parsed 'bench' options.
+    :return: int
+        The exit status: 1 when a stage regressed beyond the tolerance, 0 otherwise.
+    """
+    benchmark = Benchmark(args.work_dir, args.sizes, args.repeat)
+    results = benchmark.run()
+    save_results(results, args.results or os.path.join(args.work_dir, 'results.json'))
+
+    if args.baseline and os.path.exists(args.baseline):
+        regressions = compare_results(results, load_results(args.baseline), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed")
+            return 1
+    return 0
+
+
+def build_parser():
+    """
+    :return: argparse.ArgumentParser
+        The parser of the command line, with one subcommand per pipeline stage.
+    """
+    parser = argparse.ArgumentParser(description='Split large scale COLMAP scenes into cells and merge the cells\' '
+                                                 'Gaussian Splatting results.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_dataset_options(subparser):
+        subparser.add_argument('datasets', nargs='+', help='Dataset names, substituted for {dataset} in the paths.')
+        subparser.add_argument('--jobs', type=int, default=1, help='Number of datasets processed concurrently.')
+
+    def add_scene_options(subparser, output):
+        subparser.add_argument('--input', default=INPUT_PATTERN, help='COLMAP directory of a dataset.')
+        subparser.add_argument('--output', default=output, help='Output directory of a dataset.')
+        subparser.add_argument('--cache', action=argparse.BooleanOptionalAction, default=True,
+                               help='Reuse the decoded arrays cached next to the COLMAP files.')
+        subparser.add_argument('--budget', type=int, default=PREVIEW_POINTS, help='Points of the 3D preview.')
+        subparser.add_argument('--strategy', choices=SUBSAMPLING_STRATEGIES, default='voxel',
+                               help='Subsampling strategy of the 3D preview.')
+
+    # Split
+    split = subparsers.add_parser('split', help='Split COLMAP scenes into cells.')
+    add_dataset_options(split)
+    add_scene_options(split, OUTPUT_PATTERN)
+    split.add_argument('--rows', type=int, default=16)
+    split.add_argument('--cols', type=int, default=16)
+    split.add_argument('--max-points', type=int, default=None, help='Point budget of adaptive splitting.')
+    split.add_argument('--max-cameras', type=int, default=None, help='Camera budget of adaptive splitting.')
+    split.add_argument('--margin', type=float, default=0.0, help='Buffer zone exported around every cell.')
+    split.add_argument('--workers', type=int, default=None,
+                       help='Processes exporting the cells of a dataset (default: the CPUs shared among --jobs).')
+    split.add_argument('--incremental', action='store_true', help='Only rewrite the cells that changed.')
+    split.add_argument('--project', action='store_true', help='Also plot the loaded scene in 2D and 3D.')
+    split.add_argument('--stream', action='store_true',
+                       help='Read the points in batches and spill them to per-cell shards on disk, for scenes larger '
+                            'than memory (no adaptive splitting, overview or projection plots).')
+    split.add_argument('--batch-size', type=int, default=POINT_BATCH_SIZE, help='Points per batch with --stream.')
+    split.add_argument('--spill-dir', default=None,
+                       help='Directory the shards are spilled to with --stream, in a private subdirectory '
+                            '(default: .shards in the output directory).')
+    split.set_defaults(task=split_dataset)
+
+    # Project
+    project = subparsers.add_parser('project', help='Plot COLMAP scenes projected on the ground plane and in 3D.')
+    add_dataset_options(project)
+    add_scene_options(project, '.')
+    project.set_defaults(task=project_dataset)
+
+    # Merge
+    merge = subparsers.add_parser('merge', help='Merge the trained cells into a single .ply file.')
+    add_dataset_options(merge)
+    merge.add_argument('--splats', default=SPLATS_PATTERN, help='Directory of the cells\' .ply files.')
+    merge.add_argument('--cells', default=OUTPUT_PATTERN + '/cells.json',
+                       help='Cell manifest (or legacy cell_boundaries.txt) of a dataset.')
+    merge.add_argument('--output', default=MERGED_PATTERN, help='Path of the merged .ply file.')
+    merge.add_argument('--stream', action=argparse.BooleanOptionalAction, default=True,
+                       help='Cull and write one cell at a time instead of holding the complete scene in memory.')
+    merge.add_argument('--workers', type=int, default=None,
+                       help='Threads loading the cells without --stream (default: the CPUs shared among --jobs).')
+    merge.add_argument('--axes', type=int, nargs=2, default=None,
+                       help='Position axes the cell boundaries refer to (default: those recorded in the manifest).')
+    merge.add_argument('--incremental', action='store_true', help='Only cull again the cells that changed.')
+    merge.set_defaults(task=merge_dataset)
+
+    # Bench
+    bench = subparsers.add_parser('bench', help='Benchmark every stage on synthetic data.')
+    bench.add_argument('--sizes', nargs='+', choices=list(BENCHMARK_SIZES), default=['small', 'medium'])
+    bench.add_argument('--repeat', type=int, default=3, help='Timed runs of every stage; the fastest is kept.')
+    bench.add_argument('--work-dir', default='data/bench', help='Directory of the synthetic data and outputs.')
+    bench.add_argument('--results', default=None, help='Path of the results file (default: in the work dir).')
+    bench.add_argument('--baseline', default='data/bench/baseline.json', help='Results to compare against.')
+    bench.add_argument('--tolerance', type=float, default=0.25, help='Relative slowdown counted as a regression.')
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs the command line.
+
+    :param argv: list
+        The arguments, defaulting to sys.argv[1:].
+    :return: int
+        The exit status.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == 'split' and args.stream and (args.max_points or args.max_cameras or args.project):
+        parser.error("--stream does not support adaptive splitting (--max-points, --max-cameras) or --project")
+
+    if args.command == 'bench':
+        return run_bench(args)
+
+    # Share the CPUs among the datasets processed concurrently
+    if 'workers' in args and args.workers is None:
+        args.workers = max(1, (os.cpu_count() or 1) // max(1, min(args.jobs, len(args.datasets))))
+
+    run_datasets(args.task, args.datasets, args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
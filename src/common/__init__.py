@@ -1,3 +1,6 @@
 # src/common/__init__.py
 from .colmap_loader import COLMAPLoader
-from .visualization import SceneVisualizer
\ No newline at end of file
+from .visualization import SceneVisualizer
+from .scene import Scene, SceneView
+from .cell_index import CellIndex
+from .cell_manifest import CellManifest
@@ -0,0 +1,174 @@
+import numpy as np
+
+
+class CellIndex:
+    def __init__(self, x_edges, z_edges, atom_cells, keys):
+        """
+        Initializes the CellIndex, a spatial index over axis-aligned, non-overlapping cells on the XZ ground plane.
+
+        The plane is cut along every cell boundary into a grid of "atoms"; each atom lies inside at most one cell.
+        Locating a coordinate is then two binary searches plus a table lookup, whatever the shape of the cells.
+
+        :param x_edges: numpy.ndarray
+            Ascending X boundaries of the atoms.
+        :param z_edges: numpy.ndarray
+            Ascending Z boundaries of the atoms.
+        :param atom_cells: numpy.ndarray
+            (len(z_edges) - 1, len(x_edges) - 1) table of the cell index of every atom, or -1 outside every cell.
+        :param keys: list
+            The (row, col) key of every cell, by cell index.
+        """
+        self.x_edges = np.asarray(x_edges, dtype=np.float64)
+        self.z_edges = np.asarray(z_edges, dtype=np.float64)
+        self.atom_cells = np.asarray(atom_cells, dtype=np.int64)
+        self.keys = list(keys)
+        self.positions = {key: idx for idx, key in enumerate(self.keys)}
+
+    @classmethod
+    def from_cells(cls, cells):
+        """
+        Builds the index of arbitrary rectangular cells.
+
+        :param cells: dict or list
+            A dictionary of cell boundaries keyed by (row, col) (see SplatLoader.load_cells), or the rows x cols grid
+            of cells built by SceneSplitter.create_cells. Each cell has 'min' and 'max' [x, z] points and covers
+            [min, max) on both axes.
+        :return: CellIndex
+        """
+        if not isinstance(cells, dict):
+            cells = {(row, col): cell for row, cells_row in enumerate(cells) for col, cell in enumerate(cells_row)
+                     if cell is not None}
+
+        keys = list(cells.keys())
+        mins = np.array([cells[key]['min'] for key in keys], dtype=np.float64).reshape(-1, 2)
+        maxs = np.array([cells[key]['max'] for key in keys], dtype=np.float64).reshape(-1, 2)
+
+        x_edges = np.unique(np.concatenate((mins[:, 0], maxs[:, 0])))
+        z_edges = np.unique(np.concatenate((mins[:, 1], maxs[:, 1])))
+        atom_cells = np.full((max(len(z_edges) - 1, 0), max(len(x_edges) - 1, 0)), -1, dtype=np.int64)
+
+        # Paint the atoms covered by every cell
+        x_start = np.searchsorted(x_edges, mins[:, 0])
+        x_stop = np.searchsorted(x_edges, maxs[:, 0])
+        z_start = np.searchsorted(z_edges, mins[:, 1])
+        z_stop = np.searchsorted(z_edges, maxs[:, 1])
+        for idx in range(len(keys)):
+            atom_cells[z_start[idx]:z_stop[idx], x_start[idx]:x_stop[idx]] = idx
+
+        return cls(x_edges, z_edges, atom_cells, keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def bounds(self, idx: int):
+        """
+        :param idx: int
+            A cell index.
+        :return: dict
+            The cell boundaries, with 'min' and 'max' [x, z] points.
+        """
+        z_atoms, x_atoms = np.nonzero(self.atom_cells == idx)
+        return {
+            'min': [float(self.x_edges[x_atoms.min()]), float(self.z_edges[z_atoms.min()])],
+            'max': [float(self.x_edges[x_atoms.max() + 1]), float(self.z_edges[z_atoms.max() + 1])]
+        }
+
+    def _atoms(self, x, z):
+        """
+        :return: tuple
+            The atom column and row containing each coordinate, and whether the coordinate lies inside the atom grid.
+        """
+        atom_col = np.searchsorted(self.x_edges, x, side='right') - 1
+        atom_row = np.searchsorted(self.z_edges, z, side='right') - 1
+        inside = ((atom_col >= 0) & (atom_col < self.atom_cells.shape[1])
+                  & (atom_row >= 0) & (atom_row < self.atom_cells.shape[0]))
+        return atom_col, atom_row, inside
+
+    def locate(self, x, z):
+        """
+        Finds the cell containing each of the given ground plane coordinates.
+
+        :param x: numpy.ndarray
+            X coordinates.
+        :param z: numpy.ndarray
+            Z coordinates.
+        :return: numpy.ndarray
+            The cell index of every coordinate, or -1 for coordinates outside every cell.
+        """
+        atom_col, atom_row, inside = self._atoms(x, z)
+        cells = np.full(np.shape(atom_col), -1, dtype=np.int64)
+        cells[inside] = self.atom_cells[atom_row[inside], atom_col[inside]]
+        return cells
+
+    def locate_within(self, x, z, margin: float):
+        """
+        Finds every cell lying within a margin of each of the given ground plane coordinates, on both axes.
+
+        The atoms within the margin are enumerated with one vectorized pass per offset inside the widest atom range,
+        so the cost stays proportional to the number of coordinates.
+
+        :param x: numpy.ndarray
+            X coordinates.
+        :param z: numpy.ndarray
+            Z coordinates.
+        :param margin: float
+            The margin, in scene units. A coordinate is within the margin of a cell when it lies in the cell's box
+            widened by the margin on every side.
+        :return: tuple
+            Arrays of coordinate indices and cell indices of every match, ordered by coordinate and then by cell.
+        """
+        if margin <= 0:
+            cells = self.locate(x, z)
+            matches = np.flatnonzero(cells >= 0)
+            return matches, cells[matches]
+
+        num_rows, num_cols = self.atom_cells.shape
+
+        # Range of atoms whose widened extent contains each coordinate
+        col_min = np.searchsorted(self.x_edges, x - margin, side='right') - 1
+        col_max = np.searchsorted(self.x_edges, x + margin, side='right') - 1
+        row_min = np.searchsorted(self.z_edges, z - margin, side='right') - 1
+        row_max = np.searchsorted(self.z_edges, z + margin, side='right') - 1
+
+        near = np.flatnonzero((col_max >= 0) & (col_min < num_cols) & (row_max >= 0) & (row_min < num_rows))
+        col_min = np.clip(col_min[near], 0, num_cols - 1)
+        col_max = np.clip(col_max[near], 0, num_cols - 1)
+        row_min = np.clip(row_min[near], 0, num_rows - 1)
+        row_max = np.clip(row_max[near], 0, num_rows - 1)
+
+        matches = [np.empty(0, dtype=np.int64)]
+        cells = [np.empty(0, dtype=np.int64)]
+        col_span = int((col_max - col_min).max(initial=0)) + 1
+        row_span = int((row_max - row_min).max(initial=0)) + 1
+        for row_offset in range(row_span):
+            for col_offset in range(col_span):
+                row = row_min + row_offset
+                col = col_min + col_offset
+                valid = (row <= row_max) & (col <= col_max)
+                matches.append(near[valid])
+                cells.append(self.atom_cells[row[valid], col[valid]])
+
+        matches = np.concatenate(matches)
+        cells = np.concatenate(cells)
+
+        # Several atoms may belong to the same cell; keep each (coordinate, cell) pair once
+        keep = cells >= 0
+        pairs = np.unique(matches[keep] * len(self.keys) + cells[keep])
+        return pairs // len(self.keys), pairs % len(self.keys)
+
+    def overlapping(self, min_point, max_point):
+        """
+        Finds the cells overlapping a box.
+
+        :param min_point: The [x, z] minimum of the box.
+        :param max_point: The [x, z] maximum of the box (exclusive).
+        :return: numpy.ndarray
+            The sorted indices of the cells overlapping the box.
+        """
+        col_start = max(np.searchsorted(self.x_edges, min_point[0], side='right') - 1, 0)
+        col_stop = np.searchsorted(self.x_edges, max_point[0], side='left')
+        row_start = max(np.searchsorted(self.z_edges, min_point[1], side='right') - 1, 0)
+        row_stop = np.searchsorted(self.z_edges, max_point[1], side='left')
+
+        cells = np.unique(self.atom_cells[row_start:row_stop, col_start:col_stop])
+        return cells[cells >= 0]
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from src.common.cell_index import CellIndex
+from src.common.scene import Scene, SceneView, is_columnar
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = 'cells.json'
+
+# Position axes of the ground plane the splitter bins points on (X and Z); cell boundaries are [x, z] points
+GROUND_AXES = (0, 2)
+
+
+class CellManifest:
+    def __init__(self, grid=None, cells=None, sources=None):
+        """
+        Initializes the CellManifest, the description of a split scene shared by the splitter, the merger and the
+        incremental tooling.
+
+        :param grid: dict
+            The splitting parameters (see SceneSplitter.grid_parameters).
+        :param cells: dict
+            A dictionary keyed by (row, col) whose values hold the cell's 'min' and 'max' boundary points and,
+            when known, its 'num_points' and 'num_cameras' counts, the 'membership' hash of its point and camera
+            ids and the 'files' content hashes of its exported COLMAP files. Cells are kept in split order.
+        :param sources: dict
+            The fingerprints of the COLMAP files the scene was split from, keyed by file name
+            (see COLMAPLoader.source_fingerprints).
+        """
+        self.grid = grid if grid is not None else {}
+        self.cells = cells if cells is not None else {}
+        self.sources = sources if sources is not None else {}
+
+    @classmethod
+    def from_split(cls, cells, split_scenes, grid=None, file_hashes=None, memberships=None, counts=None,
+                   sources=None):
+        """
+        Builds the manifest of a split scene.
+
+        :param cells: list or dict
+            The grid of cells returned by SceneSplitter.split_scene (a dictionary in adaptive mode).
+        :param split_scenes: list
+            The (position, cell scene) pairs returned by SceneSplitter.split_scene.
+        :param grid: dict
+            The splitting parameters (see SceneSplitter.grid_parameters).
+        :param file_hashes: dict
+            Optional content hashes of the exported COLMAP files of every cell, keyed by position
+            (see SceneExporter.file_hashes).
+        :param memberships: dict
+            Optional membership hashes of every cell, keyed by position (see membership_hash). Computed from the
+            cell scenes when omitted.
+        :param counts: dict
+            Optional (number of points, number of cameras) of every cell, keyed by position. Counted from the cell
+            scenes when omitted; with both counts and memberships, the cell scenes are not used and may be None.
+        :param sources: dict
+            Optional fingerprints of the COLMAP files the scene was split from (see COLMAPLoader.source_fingerprints).
+        :return: CellManifest
+        """
+        file_hashes = file_hashes if file_hashes is not None else {}
+        memberships = memberships if memberships is not None else {}
+
+        entries = {}
+        for grid_pos, cell_scene in split_scenes:
+            cell = cells[grid_pos] if isinstance(cells, dict) else cells[grid_pos[0]][grid_pos[1]]
+            num_points, num_cameras = counts[grid_pos] if counts is not None else scene_counts(cell_scene)
+            entries[(grid_pos[0], grid_pos[1])] = {
+                'min': [float(value) for value in cell['min']],
+                'max': [float(value) for value in cell['max']],
+                'num_points': num_points,
+                'num_cameras': num_cameras,
+                'membership': memberships.get(grid_pos) or membership_hash(cell_scene),
+                'files': dict(file_hashes.get(grid_pos, {}))
+            }
+
+        return cls(grid, entries, sources)
+
+    @classmethod
+    def load(cls, filepath: str):
+        """
+        Loads a manifest from a JSON manifest file, or from a legacy cell_boundaries.txt file (boundaries only).
+
+        :param filepath: Path to the manifest or cell boundaries file.
+        :return: CellManifest
+        """
+        if not filepath.endswith('.json'):
+            return cls(cells=_read_boundaries_txt(filepath))
+
+        with open(filepath, 'r') as file:
+            data = json.load(file)
+
+        if data.get('version', MANIFEST_VERSION) > MANIFEST_VERSION:
+            raise ValueError(f"Unsupported cell manifest version {data['version']} in {filepath}")
+
+        cells = {}
+        for entry in data['cells']:
+            cell = dict(entry)
+            cells[(cell.pop('row'), cell.pop('col'))] = cell
+
+        return cls(data.get('grid', {}), cells, data.get('sources', {}))
+
+    def save(self, filepath: str):
+        """
+        Writes the manifest as compact JSON. Boundaries are stored with full float precision.
+
+        :param filepath: Path of the manifest file.
+        """
+        data = {
+            'version': MANIFEST_VERSION,
+            'grid': self.grid,
+            'sources': self.sources,
+            'cells': [{'row': row, 'col': col, **cell} for (row, col), cell in self.cells.items()]
+        }
+
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        with open(filepath, 'w') as file:
+            json.dump(data, file, separators=(',', ':'), default=_json_default)
+
+    def matches(self, sources=None):
+        """
+        Checks whether the manifest was split from the same source files. Only then can its cells' membership hashes
+        be compared to decide which cells are unchanged; the splitting parameters may differ.
+
+        :param sources: dict
+            The fingerprints of the source COLMAP files (see COLMAPLoader.source_fingerprints).
+        :return: bool
+        """
+        # Compare the values as they are stored, after a JSON round trip
+        return json.loads(json.dumps(sources or {}, default=_json_default)) == self.sources
+
+    def axes(self):
+        """
+        :return: tuple
+            The two position axes the cell boundaries refer to, as recorded in the grid parameters. Manifests written
+            before the axes were recorded (and legacy boundary files) were all split on GROUND_AXES.
+        """
+        return tuple(self.grid.get('axes', GROUND_AXES))
+
+    def boundaries(self):
+        """
+        :return: dict
+            A dictionary where the keys are (row, col) tuples and the values are dictionaries with 'min' and 'max'
+            keys containing the boundary points, as returned by SplatLoader.load_cells.
+        """
+        return {pos: {'min': list(cell['min']), 'max': list(cell['max'])} for pos, cell in self.cells.items()}
+
+    def cell_index(self):
+        """
+        :return: CellIndex
+            A spatial index over the cells.
+        """
+        return CellIndex.from_cells(self.boundaries())
+
+    def bounds(self):
+        """
+        :return: dict
+            The bounding box of all cells, with 'min' and 'max' [x, z] points, or None for an empty manifest.
+        """
+        if not self.cells:
+            return None
+
+        mins = np.array([cell['min'] for cell in self.cells.values()], dtype=np.float64)
+        maxs = np.array([cell['max'] for cell in self.cells.values()], dtype=np.float64)
+        return {'min': mins.min(axis=0).tolist(), 'max': maxs.max(axis=0).tolist()}
+
+
+def scene_counts(scene):
+    """
+    Counts the points and cameras (images) of a scene without materializing it.
+
+    :param scene: dict, Scene or SceneView
+    :return: tuple
+        The number of points and the number of cameras.
+    """
+    if isinstance(scene, (Scene, SceneView)):
+        return int(scene.num_points), int(scene.num_images)
+
+    points = scene['points']
+    cameras = scene['cameras']
+    num_points = len(points['ids']) if is_columnar(points) else len(points)
+    num_cameras = len(cameras['ids']) if is_columnar(cameras) else len(cameras)
+    return num_points, num_cameras
+
+
+def membership_hash(scene):
+    """
+    Hashes the ids of the points and cameras (images) of a scene, in order. The ids say nothing about the points' and
+    cameras' values, so the hashes of two splits are only comparable when both were split from the same source files
+    (see CellManifest.matches).
+
+    :param scene: dict, Scene or SceneView
+    :return: str
+        The SHA-1 hex digest of the point and camera ids.
+    """
+    if isinstance(scene, SceneView):
+        point_ids = np.asarray(scene.parent.points['ids'])[scene.point_rows]
+        image_ids = np.asarray(scene.parent.images['ids'])[scene.image_rows]
+    else:
+        points = scene['points']
+        cameras = scene['cameras']
+        point_ids = points['ids'] if is_columnar(points) else list(points.keys())
+        image_ids = cameras['ids'] if is_columnar(cameras) else list(cameras.keys())
+
+    digest = hashlib.sha1()
+    digest.update(np.asarray(point_ids, dtype='<i8').tobytes())
+    digest.update(b'|')
+    digest.update(np.asarray(image_ids, dtype='<i8').tobytes())
+    return digest.hexdigest()
+
+
+def _read_boundaries_txt(filepath: str):
+    """
+    Reads the cell boundaries of a legacy cell_boundaries.txt file: three lines per cell, holding its row and column,
+    its min point and its max point.
+
+    :param filepath: Path to the cell_boundaries.txt file.
+    :return: dict
+        A dictionary keyed by (row, col) of dictionaries with 'min' and 'max' keys.
+    """
+    cell_boundaries = {}
+
+    with open(filepath, 'r') as file:
+        while True:
+            line = file.readline().strip()
+            if not line:
+                break
+
+            # Parse the row and column
+            row, col = map(int, line.split())
+
+            # Parse the boundary points (min and max)
+            min_line = file.readline().strip()
+            max_line = file.readline().strip()
+
+            min_x, min_z = map(float, min_line.split())
+            max_x, max_z = map(float, max_line.split())
+
+            # Store the boundary information in the dictionary
+            cell_boundaries[(row, col)] = {
+                'min': [min_x, min_z],
+                'max': [max_x, max_z]
+            }
+
+    return cell_boundaries
+
+
+def _json_default(value):
+    """
+    Converts the numpy scalars found in grid parameters to plain JSON values.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
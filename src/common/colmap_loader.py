@@ -1,65 +1,271 @@
+import hashlib
+import json
+import os
 import struct
 
 import numpy as np
 
+from src.common.instrumentation import stage, count_bytes
+from src.common.scene import Scene, points3D_to_dict, images_to_dict
+from src.common.subsampling import PREVIEW_POINTS, subsample_points, preview_scene
+
+# Fixed-size part of a point record in 'points3D.bin': point3D_id, xyz, rgb, error and track length
+POINT3D_RECORD_DTYPE = np.dtype([
+    ('id', '<u8'),
+    ('xyz', '<f8', (3,)),
+    ('rgb', 'u1', (3,)),
+    ('error', '<f8'),
+    ('track_length', '<u8')
+])
+
+# Fixed-size header of an image record in 'images.bin': image_id, qvec, tvec and camera_id
+IMAGE_RECORD_DTYPE = np.dtype([
+    ('id', '<u4'),
+    ('qvec', '<f8', (4,)),
+    ('tvec', '<f8', (3,)),
+    ('camera_id', '<u4')
+])
+
+# Number of intrinsic parameters of every COLMAP camera model, by model_id
+CAMERA_MODEL_NUM_PARAMS = {
+    0: 3,   # SIMPLE_PINHOLE
+    1: 4,   # PINHOLE
+    2: 4,   # SIMPLE_RADIAL
+    3: 5,   # RADIAL
+    4: 8,   # OPENCV
+    5: 8,   # OPENCV_FISHEYE
+    6: 12,  # FULL_OPENCV
+    7: 5,   # FOV
+    8: 4,   # SIMPLE_RADIAL_FISHEYE
+    9: 5,   # RADIAL_FISHEYE
+    10: 12  # THIN_PRISM_FISHEYE
+}
+
+# Width of the padded intrinsic parameter rows
+MAX_CAMERA_PARAMS = max(CAMERA_MODEL_NUM_PARAMS.values())
+
+# Version of the cached columnar scene layout; bump it whenever the decoded arrays change
+CACHE_VERSION = 1
+
+# Name of the cache directory kept next to the COLMAP binary files
+CACHE_DIR = '.lss_cache'
+
+# Default number of points of every batch of COLMAPLoader.iter_points3D
+POINT_BATCH_SIZE = 1_000_000
+
+# Default number of bytes read at a time by COLMAPLoader.iter_points3D
+READ_SIZE = 64 << 20
+
+# Offset of the track length inside a point record
+_TRACK_LENGTH_OFFSET = POINT3D_RECORD_DTYPE.fields['track_length'][1]
+
 
 class COLMAPLoader:
-    def __init__(self, path_to_scene: str):
+    def __init__(self, path_to_scene: str, use_cache: bool = True):
         """
         Initializes the COLMAPLoader with the path to the scene directory.
 
         :param path_to_scene: Path to the directory containing COLMAP binary files.
+        :param use_cache: If True, columnar loads are cached as memory-mappable .npy files in a '.lss_cache'
+                          directory next to the binary files, and reused as long as the source files are unchanged.
+                          Cache files are replaced atomically, so runs sharing a scene never read a partial file.
         """
         self.path_to_scene = path_to_scene
+        self.use_cache = use_cache
 
-    def load_points3D(self):
+    def load_points3D_columnar(self):
         """
-        Loads the 3D points from the COLMAP binary file 'points3D.bin'.
+        Loads the 3D points from the COLMAP binary file 'points3D.bin' into flat NumPy arrays.
+
+        The whole file is read into memory at once; only the track lengths are walked sequentially, every other field
+        is decoded in bulk. Tracks are stored in CSR layout: the observations of the i-th point are
+        track_image_ids[track_offsets[i]:track_offsets[i + 1]] (and likewise for track_point2d_idxs).
+
+        :return: A dictionary containing:
+                 - "ids": (N,) uint64 array of point3D_ids
+                 - "xyz": (N, 3) float64 array of point coordinates
+                 - "rgb": (N, 3) uint8 array of RGB color values
+                 - "error": (N,) float64 array of reprojection errors
+                 - "track_offsets": (N + 1,) int64 array of offsets into the track arrays
+                 - "track_image_ids": (T,) uint32 array of observing image_ids
+                 - "track_point2d_idxs": (T,) uint32 array of observed 2D point indices
+        """
+        with stage('points3D'):
+            points = self._load_cached('points3D.bin', self._decode_points3D)
+        num_points3D = len(points['ids'])
 
-        :return: A dictionary where keys are point3D_ids and values are dictionaries containing
-                 point coordinates (xyz), RGB color values, reprojection error, and track information.
+        print(f"Loaded {num_points3D} points with {len(points['track_image_ids'])} track elements")
+
+        return num_points3D, points
+
+    def _decode_points3D(self):
         """
-        points3D = {}
-        # Open the binary file for reading
-        with open(self.path_to_scene + '/points3D.bin', "rb") as f:
+        Decodes 'points3D.bin' into flat arrays (see load_points3D_columnar).
+        """
+        # Read the entire binary file
+        buffer = np.fromfile(self.path_to_scene + '/points3D.bin', dtype=np.uint8)
+        count_bytes(read=len(buffer))
+
+        # Read the number of 3D points
+        num_points3D = struct.unpack_from('<Q', buffer, 0)[0]
+
+        # Locate every point record and decode all of them at once
+        starts, track_lengths, end = _scan_point_records(buffer, 8, num_points3D)
+        if len(starts) != num_points3D:
+            raise ValueError(f"Truncated points3D.bin in {self.path_to_scene}: "
+                             f"{num_points3D - len(starts)} of {num_points3D} points missing")
+        if end != len(buffer):
+            raise ValueError(f"Corrupt points3D.bin in {self.path_to_scene}: "
+                             f"{len(buffer) - end} bytes after the last point")
+        return _decode_point_records(buffer, starts, track_lengths)
+
+    def iter_points3D(self, batch_size: int = POINT_BATCH_SIZE, read_size: int = READ_SIZE):
+        """
+        Iterates over the 3D points of the COLMAP binary file 'points3D.bin' in fixed-size batches, reading the file
+        sequentially, so scenes larger than memory can be processed. Only the current batch and one read block are
+        held at any time; the cache is neither used nor written.
+
+        :param batch_size: int
+            Number of points of every batch (the last one may be smaller).
+        :param read_size: int
+            Number of bytes read from the file at a time.
+        :return: An iterator of dictionaries of point arrays, laid out like load_points3D_columnar's (track offsets
+                 start at 0 in every batch), in file order.
+        """
+        with open(self.path_to_scene + '/points3D.bin', 'rb') as f:
             # Read the number of 3D points
             num_points3D = struct.unpack('<Q', f.read(8))[0]
+            count_bytes(read=8)
+
+            pending = np.empty(0, dtype=np.uint8)
+            offset = 0
+            starts, track_lengths = [], []
+            remaining = num_points3D
+            while remaining > 0:
+                # Locate as many records of the batch as the bytes read so far hold
+                wanted = min(batch_size, remaining) - sum(len(part) for part in starts)
+                part_starts, part_track_lengths, offset = _scan_point_records(pending, offset, wanted)
+                starts.append(part_starts)
+                track_lengths.append(part_track_lengths)
+
+                if len(part_starts) < wanted:
+                    # Read the next block, keeping the bytes of the batch read so far
+                    block = np.fromfile(f, dtype=np.uint8, count=read_size)
+                    count_bytes(read=len(block))
+                    if len(block) == 0:
+                        raise ValueError(f"Truncated points3D.bin in {self.path_to_scene}: "
+                                         f"{remaining - sum(len(part) for part in starts)} points missing")
+                    pending = np.concatenate((pending, block))
+                    continue
+
+                # Decode the batch and drop its bytes
+                batch = _decode_point_records(pending, np.concatenate(starts), np.concatenate(track_lengths))
+                remaining -= len(batch['ids'])
+                pending = pending[offset:]
+                offset = 0
+                starts, track_lengths = [], []
+                yield batch
 
-            # Iterate over each 3D point
-            for i in range(num_points3D):
-                print(f"Loading #{i} point...")
-
-                # Read point3d_id
-                point3d_id = struct.unpack('<Q', f.read(8))[0]
+    def load_points3D(self):
+        """
+        Loads the 3D points from the COLMAP binary file 'points3D.bin'.
 
-                # Read the coordinates of the point (x, y, z)
-                xyz = struct.unpack('<ddd', f.read(8 * 3))
+        :return: A dictionary where keys are point3D_ids and values are dictionaries containing
+                 point coordinates (xyz), RGB color values, reprojection error, and track information.
+        """
+        num_points3D, points = self.load_points3D_columnar()
 
-                # Read the RGB color values of the point
-                rgb = struct.unpack('<BBB', f.read(3))
+        return num_points3D, points3D_to_dict(points)
 
-                # Read the reprojection error of the point
-                error = struct.unpack('<d', f.read(8))[0]
+    def load_images_columnar(self):
+        """
+        Loads the images from the COLMAP binary file 'images.bin' into flat NumPy arrays.
+
+        The 2D points of all images are concatenated into single buffers; the points of the i-th image are
+        xys[point2d_offsets[i]:point2d_offsets[i + 1]] (and likewise for point3d_ids).
+
+        :return: A dictionary containing:
+                 - "ids": (M,) uint32 array of image_ids
+                 - "qvec": (M, 4) float64 array of quaternions
+                 - "tvec": (M, 3) float64 array of translation vectors
+                 - "camera_id": (M,) uint32 array of camera_ids
+                 - "name": list of M image names
+                 - "point2d_offsets": (M + 1,) int64 array of offsets into the 2D point arrays
+                 - "xys": (K, 2) float64 array of 2D point coordinates
+                 - "point3d_ids": (K,) int64 array of the 3D point ids associated with each 2D point
+        """
+        with stage('images'):
+            images = self._load_cached('images.bin', self._decode_images)
+        num_images = len(images['ids'])
 
-                # Read the length of the track (number of observations)
-                track_length = struct.unpack('<Q', f.read(8))[0]
+        print(f"Loaded {num_images} images with {len(images['point3d_ids'])} 2D points")
 
-                # Read the track elements (image_id and point2d_idx for each observation)
-                track_elements = []
-                for _ in range(track_length):
-                    image_id = struct.unpack('<I', f.read(4))[0]
-                    point2d_idx = struct.unpack('<I', f.read(4))[0]
-                    track_elements.append((image_id, point2d_idx))
+        return num_images, images
 
-                # Store the information in the dictionary
-                points3D[point3d_id] = {
-                    "xyz": np.array(xyz),
-                    "rgb": np.array(rgb),
-                    "error": error,
-                    "track": track_elements
-                }
+    def _decode_images(self):
+        """
+        Decodes 'images.bin' into flat arrays (see load_images_columnar).
+        """
+        # Read the entire binary file
+        with open(self.path_to_scene + '/images.bin', "rb") as f:
+            data = f.read()
+        count_bytes(read=len(data))
+        buffer = np.frombuffer(data, dtype=np.uint8)
+
+        # Read the number of images
+        num_images = struct.unpack_from('<Q', data, 0)[0]
+
+        # Locate the fixed-size header, the name and the 2D points of every image
+        header_size = IMAGE_RECORD_DTYPE.itemsize
+        unpack_from = struct.Struct('<Q').unpack_from
+        header_starts = np.empty(num_images, dtype=np.int64)
+        names = []
+        point2d_starts = np.empty(num_images, dtype=np.int64)
+        point2d_offsets = np.zeros(num_images + 1, dtype=np.int64)
+
+        offset = 8
+        for i in range(num_images):
+            header_starts[i] = offset
+
+            # The image name is terminated by a null byte
+            name_start = offset + header_size
+            name_end = data.find(b'\x00', name_start)
+            names.append(data[name_start:name_end].decode('utf-8'))
+
+            # Read the number of 2D points in this image
+            num_points2d = unpack_from(data, name_end + 1)[0]
+            point2d_starts[i] = name_end + 9
+            point2d_offsets[i + 1] = point2d_offsets[i] + num_points2d
+
+            offset = name_end + 9 + 24 * num_points2d
+
+        # Decode the fixed-size headers in bulk
+        header_bytes = buffer[header_starts[:, None] + np.arange(header_size)]
+        headers = header_bytes.reshape(-1).view(IMAGE_RECORD_DTYPE)
+
+        # Gather the 2D points of all images into the concatenated buffers
+        num_points2d_total = int(point2d_offsets[-1])
+        xys = np.empty((num_points2d_total, 2), dtype=np.float64)
+        point3d_ids = np.empty(num_points2d_total, dtype=np.int64)
+        for i in range(num_images):
+            start, end = point2d_offsets[i], point2d_offsets[i + 1]
+            count = end - start
+            xys_offset = int(point2d_starts[i])
+            xys[start:end] = np.frombuffer(data, dtype='<f8', count=2 * count, offset=xys_offset).reshape(-1, 2)
+            point3d_ids[start:end] = np.frombuffer(data, dtype='<i8', count=count, offset=xys_offset + 16 * count)
+
+        images = {
+            "ids": np.ascontiguousarray(headers['id']),
+            "qvec": np.ascontiguousarray(headers['qvec']),
+            "tvec": np.ascontiguousarray(headers['tvec']),
+            "camera_id": np.ascontiguousarray(headers['camera_id']),
+            "name": names,
+            "point2d_offsets": point2d_offsets,
+            "xys": xys,
+            "point3d_ids": point3d_ids
+        }
 
-        return num_points3D, points3D
+        return images
 
     def load_images(self):
         """
@@ -69,56 +275,162 @@ class COLMAPLoader:
                  quaternion (qvec), translation vector (tvec), camera_id, image name, 2D points coordinates (xys),
                  and associated 3D point ids (point3d_ids).
         """
-        images = {}
-        # Open the binary file for reading
-        with open(self.path_to_scene + '/images.bin', "rb") as f:
-            # Read the number of images
-            num_images = struct.unpack('<Q', f.read(8))[0]
+        num_images, images = self.load_images_columnar()
 
-            # Iterate over each image
-            for i in range(num_images):
-                print(f"Loading #{i} image...")
+        return num_images, images_to_dict(images)
 
-                # Read image_id
-                image_id = struct.unpack('<I', f.read(4))[0]
+    def load_cameras_columnar(self):
+        """
+        Loads the camera intrinsics from the COLMAP binary file 'cameras.bin' into flat NumPy arrays.
+
+        :return: A dictionary containing:
+                 - "ids": (C,) int32 array of camera_ids
+                 - "model_id": (C,) int32 array of camera model ids
+                 - "width": (C,) uint64 array of image widths
+                 - "height": (C,) uint64 array of image heights
+                 - "params": (C, 12) float64 array of intrinsic parameters, zero-padded past the model's parameters
+                 - "num_params": (C,) int64 array of the number of parameters of each camera's model
+        """
+        with stage('cameras'):
+            cameras = self._load_cached('cameras.bin', self._decode_cameras)
+        num_cameras = len(cameras['ids'])
 
-                # Read the quaternion (qvec) representing the camera orientation
-                qvec = struct.unpack('<dddd', f.read(8 * 4))
+        print(f"Loaded {num_cameras} cameras")
 
-                # Read the translation vector (tvec) representing the camera position
-                tvec = struct.unpack('<ddd', f.read(8 * 3))
+        return num_cameras, cameras
 
-                # Read the camera_id used for this image
-                camera_id = struct.unpack('<I', f.read(4))[0]
+    def _decode_cameras(self):
+        """
+        Decodes 'cameras.bin' into flat arrays (see load_cameras_columnar).
+        """
+        with open(self.path_to_scene + '/cameras.bin', "rb") as f:
+            data = f.read()
+        count_bytes(read=len(data))
+
+        # Read the number of cameras
+        num_cameras = struct.unpack_from('<Q', data, 0)[0]
+
+        cameras = {
+            "ids": np.empty(num_cameras, dtype=np.int32),
+            "model_id": np.empty(num_cameras, dtype=np.int32),
+            "width": np.empty(num_cameras, dtype=np.uint64),
+            "height": np.empty(num_cameras, dtype=np.uint64),
+            "params": np.zeros((num_cameras, MAX_CAMERA_PARAMS), dtype=np.float64),
+            "num_params": np.empty(num_cameras, dtype=np.int64)
+        }
 
-                # Read the image name, which is terminated by a null byte
-                name = ""
-                while True:
-                    char = f.read(1).decode('utf-8')
-                    if char == '\x00':
-                        break
-                    name += char
+        offset = 8
+        for i in range(num_cameras):
+            # Read camera_id, model_id, width and height
+            camera_id, model_id, width, height = struct.unpack_from('<iiQQ', data, offset)
+            num_params = CAMERA_MODEL_NUM_PARAMS[model_id]
 
-                # Read the number of 2D points in this image
-                num_points2d = struct.unpack('<Q', f.read(8))[0]
+            # Read the intrinsic parameters of the camera model
+            cameras['params'][i, :num_params] = struct.unpack_from('<' + 'd' * num_params, data, offset + 24)
 
-                # Read the coordinates of the 2D points (x, y)
-                xys = struct.unpack('<' + 'dd' * num_points2d, f.read(8 * 2 * num_points2d))
+            cameras['ids'][i] = camera_id
+            cameras['model_id'][i] = model_id
+            cameras['width'][i] = width
+            cameras['height'][i] = height
+            cameras['num_params'][i] = num_params
 
-                # Read the 3D point ids associated with each 2D point
-                point3d_ids = struct.unpack('<' + 'q' * num_points2d, f.read(8 * num_points2d))
+            offset += 24 + 8 * num_params
 
-                # Store the information in the dictionary
-                images[image_id] = {
-                    "qvec": np.array(qvec),
-                    "tvec": np.array(tvec),
-                    "camera_id": camera_id,
-                    "name": name,
-                    "xys": np.array(xys).reshape(-1, 2),
-                    "point3d_ids": np.array(point3d_ids)
-                }
+        return cameras
 
-        return num_images, images
+    def load_cameras(self):
+        """
+        Loads the camera intrinsics from the COLMAP binary file 'cameras.bin'.
+
+        :return: A dictionary where keys are camera_ids and values are dictionaries containing
+                 the camera model id, image width and height, and intrinsic parameters (params).
+        """
+        num_cameras, cameras = self.load_cameras_columnar()
+
+        result = {}
+        for i, camera_id in enumerate(cameras['ids'].tolist()):
+            result[camera_id] = {
+                "model_id": int(cameras['model_id'][i]),
+                "width": int(cameras['width'][i]),
+                "height": int(cameras['height'][i]),
+                "params": cameras['params'][i, :cameras['num_params'][i]]
+            }
+
+        return num_cameras, result
+
+    def source_fingerprints(self):
+        """
+        Fingerprints the COLMAP binary files of the scene (see file_fingerprint), so a split can tell whether it was
+        made from the same files as an earlier one.
+
+        :return: dict
+            The fingerprints of 'points3D.bin', 'images.bin' and 'cameras.bin', keyed by file name. Missing files are
+            left out.
+        """
+        fingerprints = {}
+        for file_name in ('points3D.bin', 'images.bin', 'cameras.bin'):
+            path = os.path.join(self.path_to_scene, file_name)
+            if os.path.exists(path):
+                fingerprints[file_name] = file_fingerprint(path)
+
+        return fingerprints
+
+    def _load_cached(self, file_name: str, decode, cache_name: str = None):
+        """
+        Returns the decoded arrays of a COLMAP binary file, from the cache when it is still valid.
+
+        The cache of a file is a directory of .npy files plus a 'meta.json' holding the key of the source file it was
+        built from (size, modification time and a hash of its first and last MiB). Arrays are memory-mapped from the
+        cache, so later runs skip decoding entirely. A cache whose key no longer matches is rebuilt.
+
+        :param file_name: Name of the binary file inside the scene directory (e.g., 'points3D.bin').
+        :param decode: Callable decoding the file into a dictionary of arrays (and lists of strings).
+        :param cache_name: Name of the cache directory, for arrays derived from the file. Defaults to the file name
+                           without its extension.
+        :return: The dictionary of decoded arrays.
+        """
+        if not self.use_cache:
+            return decode()
+
+        source_path = os.path.join(self.path_to_scene, file_name)
+        cache_dir = os.path.join(self.path_to_scene, CACHE_DIR, cache_name or os.path.splitext(file_name)[0])
+        meta_path = os.path.join(cache_dir, 'meta.json')
+        key = _cache_key(source_path)
+
+        # Reuse the cache when it was built from the same source file
+        try:
+            with open(meta_path, 'r') as meta_file:
+                meta = json.load(meta_file)
+            if meta['key'] == key:
+                arrays = {}
+                for name in meta['arrays']:
+                    arrays[name] = np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r')
+                for name in meta['lists']:
+                    arrays[name] = np.load(os.path.join(cache_dir, name + '.npy')).tolist()
+                return arrays
+        except (OSError, ValueError, KeyError):
+            pass
+
+        arrays = decode()
+
+        # Rebuild the cache; the metadata is written last so an interrupted write is never picked up
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            for name, values in arrays.items():
+                _replace_file(os.path.join(cache_dir, name + '.npy'),
+                              lambda cache_file, values=values: np.save(cache_file, np.asarray(values)))
+            meta = {
+                'key': key,
+                'arrays': [name for name, values in arrays.items() if isinstance(values, np.ndarray)],
+                'lists': [name for name, values in arrays.items() if not isinstance(values, np.ndarray)]
+            }
+            _replace_file(meta_path, lambda meta_file: meta_file.write(json.dumps(meta).encode()))
+        except OSError as e:
+            print(f"WARNING: Could not write the scene cache to {cache_dir}: {e}")
+
+        return arrays
 
     def load_scene(self):
         """
@@ -152,3 +464,186 @@ class COLMAPLoader:
         }
 
         return num_points3D, num_images, scene
+
+    def load_scene_columnar(self):
+        """
+        Loads the complete COLMAP scene data like load_scene, but keeps it in columnar form
+        (see load_points3D_columnar, load_images_columnar and load_cameras_columnar).
+
+        The camera intrinsics are loaded as well when 'cameras.bin' is present.
+
+        :return: Scene
+            A Scene holding the point, image and camera intrinsics arrays. It also supports the "points" and
+            "cameras" keys of the scene dictionary returned by load_scene.
+        """
+        with stage('load'):
+            # Load points
+            num_points3D, points3D = self.load_points3D_columnar()
+
+            # Load cameras
+            num_images, images = self.load_images_columnar()
+
+            # Load camera intrinsics
+            intrinsics = None
+            if os.path.exists(os.path.join(self.path_to_scene, 'cameras.bin')):
+                _, intrinsics = self.load_cameras_columnar()
+
+            scene = Scene(points3D, images, intrinsics)
+
+        return num_points3D, num_images, scene
+
+    def load_preview(self, budget: int = PREVIEW_POINTS, strategy: str = 'voxel', scene=None):
+        """
+        Loads a fixed-budget preview of the scene: a deterministic subset of its points with all of its cameras
+        (see subsampling.subsample_points).
+
+        The selected rows are cached next to the decoded arrays, keyed by the 'points3D.bin' file they were selected
+        from, so the subsampling runs once per dataset, budget and strategy.
+
+        :param budget: int
+            Maximum number of points of the preview.
+        :param strategy: str
+            The subsampling strategy: 'voxel', 'cell' or 'error'.
+        :param scene: Scene
+            The scene returned by load_scene_columnar, when already loaded.
+        :return: tuple
+            The number of points and images of the complete scene, and a SceneView holding the preview points.
+        """
+        if scene is None:
+            _, _, scene = self.load_scene_columnar()
+
+        def select():
+            return {'rows': subsample_points(scene.points, budget, strategy)}
+
+        rows = self._load_cached('points3D.bin', select, f"preview_{strategy}_{budget}")['rows']
+
+        return scene.num_points, scene.num_images, preview_scene(scene, rows=np.asarray(rows))
+
+
+def file_fingerprint(path: str):
+    """
+    Computes a cheap fingerprint of a file's content, without reading the whole file.
+
+    :param path: Path to the file.
+    :return: A dictionary with the file size, modification time and a SHA-1 of its first and last MiB.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        digest.update(f.read(1 << 20))
+        if stat.st_size > 1 << 20:
+            f.seek(max(stat.st_size - (1 << 20), 1 << 20))
+            digest.update(f.read())
+
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha1': digest.hexdigest()
+    }
+
+
+def _replace_file(path: str, write):
+    """
+    Writes a file through a temporary file that is then renamed over it. Processes that memory-mapped the previous
+    file keep reading it intact, and no process ever opens a partly written file.
+
+    :param path: Path of the file.
+    :param write: Callable writing the content to the binary file object it is given.
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as temp_file:
+            write(temp_file)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _cache_key(source_path: str):
+    """
+    Computes the key identifying the version of a source file a cache was built from.
+
+    :param source_path: Path to the source file.
+    :return: A dictionary with the cache layout version and the fingerprint of the file (see file_fingerprint).
+    """
+    return {'version': CACHE_VERSION, **file_fingerprint(source_path)}
+
+
+def _scan_point_records(buffer, offset: int, count: int):
+    """
+    Walks over consecutive point records to find where each one starts.
+
+    Records have a variable length (the track follows the fixed-size part), so only the track lengths are read here;
+    everything else is left to be decoded in bulk.
+
+    :param buffer: Buffer containing the raw point records.
+    :param offset: Byte offset of the first record.
+    :param count: Maximum number of records to scan.
+    :return: Tuple of (record start offsets, track lengths, offset right after the last complete record).
+             Scanning stops early at the first record that is not entirely contained in the buffer.
+    """
+    record_size = POINT3D_RECORD_DTYPE.itemsize
+    buffer_size = len(buffer)
+    unpack_from = struct.Struct('<Q').unpack_from
+
+    starts = []
+    track_lengths = []
+    for _ in range(count):
+        if offset + record_size > buffer_size:
+            break
+        track_length = unpack_from(buffer, offset + _TRACK_LENGTH_OFFSET)[0]
+        end = offset + record_size + 8 * track_length
+        if end > buffer_size:
+            break
+        starts.append(offset)
+        track_lengths.append(track_length)
+        offset = end
+
+    return np.array(starts, dtype=np.int64), np.array(track_lengths, dtype=np.int64), offset
+
+
+def _decode_point_records(buffer, starts, track_lengths):
+    """
+    Decodes point records located by _scan_point_records into flat arrays.
+
+    The fixed-size parts and the track elements are separated with a single byte mask over the records' span, so both
+    can be reinterpreted in place with NumPy instead of being unpacked one value at a time.
+
+    :param buffer: uint8 array containing the raw point records.
+    :param starts: Start offsets of the records.
+    :param track_lengths: Track lengths of the records.
+    :return: A dictionary of point arrays (see COLMAPLoader.load_points3D_columnar).
+    """
+    record_size = POINT3D_RECORD_DTYPE.itemsize
+    track_offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+    np.cumsum(track_lengths, out=track_offsets[1:])
+
+    if len(starts) == 0:
+        records = np.empty(0, dtype=POINT3D_RECORD_DTYPE)
+        tracks = np.empty((0, 2), dtype='<u4')
+    else:
+        # Restrict to the span covered by the records
+        begin = starts[0]
+        end = starts[-1] + record_size + 8 * track_lengths[-1]
+        span = np.asarray(buffer[begin:end], dtype=np.uint8)
+        local_starts = starts - begin
+
+        # Mark the bytes belonging to the fixed-size parts of the records
+        marks = np.zeros(len(span) + 1, dtype=np.int8)
+        marks[local_starts] = 1
+        marks[local_starts + record_size] -= 1
+        fixed_mask = np.cumsum(marks[:-1], dtype=np.int8).view(np.bool_)
+
+        records = span[fixed_mask].view(POINT3D_RECORD_DTYPE)
+        tracks = span[~fixed_mask].view('<u4').reshape(-1, 2)
+
+    return {
+        "ids": np.ascontiguousarray(records['id']),
+        "xyz": np.ascontiguousarray(records['xyz']),
+        "rgb": np.ascontiguousarray(records['rgb']),
+        "error": np.ascontiguousarray(records['error']),
+        "track_offsets": track_offsets,
+        "track_image_ids": np.ascontiguousarray(tracks[:, 0]),
+        "track_point2d_idxs": np.ascontiguousarray(tracks[:, 1])
+    }
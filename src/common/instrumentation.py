@@ -0,0 +1,270 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Shared no-op context manager returned by stage() while instrumentation is disabled
+_NO_STAGE = nullcontext()
+
+
+class Instrumentation:
+    def __init__(self, enabled: bool = False, progress_interval: float = 1.0):
+        """
+        Initializes the Instrumentation, which times the stages of a run and reports progress.
+
+        Each stage records its wall and CPU time, the bytes it read and wrote and how far the resident set size grew
+        above its value at the start of the stage (sampled while the stage runs, see RSSSampler). Stages nest; a nested stage is named after its parents (e.g., 'split/export'). While disabled, every call
+        returns immediately.
+
+        :param enabled: bool
+            Whether stages and progress are recorded.
+        :param progress_interval: float
+            Minimum number of seconds between two progress lines of the same task.
+        """
+        self.enabled = enabled
+        self.progress_interval = progress_interval
+        self.stages = {}
+        self._stack = []
+        self._last_progress = {}
+        self._started = time.time()
+        self._start_wall = time.perf_counter()
+
+    def stage(self, name: str):
+        """
+        Opens a stage, to be used as a context manager.
+
+        :param name: str
+            The name of the stage.
+        :return: A context manager recording the stage.
+        """
+        if not self.enabled:
+            return _NO_STAGE
+        return _Stage(self, name)
+
+    def count_bytes(self, read: int = 0, written: int = 0):
+        """
+        Adds bytes read and written to the innermost open stage and to its parents.
+
+        :param read: int
+            Number of bytes read.
+        :param written: int
+            Number of bytes written.
+        """
+        if not self.enabled:
+            return
+        for frame in self._stack:
+            frame['bytes_read'] += read
+            frame['bytes_written'] += written
+
+    def progress(self, task: str, done: int, total: int = None):
+        """
+        Prints the progress of a task, at most once per progress interval (and always when it completes).
+
+        :param task: str
+            The name of the task.
+        :param done: int
+            Number of items done.
+        :param total: int
+            Total number of items, when known.
+        """
+        if not self.enabled:
+            return
+
+        now = time.perf_counter()
+        finished = total is not None and done >= total
+        if not finished and now - self._last_progress.get(task, -self.progress_interval) < self.progress_interval:
+            return
+        self._last_progress[task] = now
+
+        if total:
+            print(f"{task}: {done}/{total} ({100 * done / total:.1f}%)")
+        else:
+            print(f"{task}: {done}")
+
+    def report(self):
+        """
+        :return: dict
+            The machine-readable run report: the stages in the order they were first opened, with their number of
+            calls, total wall and CPU times (seconds), bytes read and written and largest RSS growth over one call
+            (bytes, Linux only), plus the run's start time, total wall time and the peak RSS of the whole process.
+        """
+        return {
+            'started': self._started,
+            'wall_time': time.perf_counter() - self._start_wall,
+            'peak_rss': peak_rss(),
+            'stages': [{'name': name, **record} for name, record in self.stages.items()]
+        }
+
+    def save_report(self, path: str):
+        """
+        Writes the run report (see report) as JSON.
+
+        :param path: str
+            Path of the report file.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+        print(f"Run report written to {path}")
+
+    def reset(self):
+        """
+        Discards the recorded stages and restarts the run clock.
+        """
+        self.stages = {}
+        self._stack = []
+        self._last_progress = {}
+        self._started = time.time()
+        self._start_wall = time.perf_counter()
+
+
+class _Stage:
+    __slots__ = ('instrumentation', 'name', 'frame', 'sampler')
+
+    def __init__(self, instrumentation: Instrumentation, name: str):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.frame = None
+        self.sampler = RSSSampler()
+
+    def __enter__(self):
+        stack = self.instrumentation._stack
+        full_name = stack[-1]['name'] + '/' + self.name if stack else self.name
+        self.frame = {
+            'name': full_name,
+            'wall': time.perf_counter(),
+            'cpu': time.process_time(),
+            'bytes_read': 0,
+            'bytes_written': 0
+        }
+        stack.append(self.frame)
+        self.sampler.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.sampler.__exit__(exc_type, exc_value, traceback)
+        frame = self.frame
+        self.instrumentation._stack.pop()
+
+        record = self.instrumentation.stages.setdefault(frame['name'], {
+            'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'bytes_read': 0, 'bytes_written': 0, 'stage_rss': 0
+        })
+        record['calls'] += 1
+        record['wall_time'] += time.perf_counter() - frame['wall']
+        record['cpu_time'] += time.process_time() - frame['cpu']
+        record['bytes_read'] += frame['bytes_read']
+        record['bytes_written'] += frame['bytes_written']
+        record['stage_rss'] = max(record['stage_rss'], self.sampler.peak)
+        return False
+
+
+def peak_rss():
+    """
+    :return: int
+        The peak resident set size of the process so far, in bytes, or 0 where it cannot be measured.
+    """
+    if resource is None:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def current_rss():
+    """
+    :return: int
+        The current resident set size of the process, in bytes, or 0 where it cannot be measured (it is read from
+        /proc, so only on Linux).
+    """
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class RSSSampler:
+    def __init__(self, interval: float = 0.01):
+        """
+        Initializes the RSSSampler, a context manager that samples the resident set size of the process in a
+        background thread while it is open, so the peak of one block of code can be told apart from the peak of the
+        whole process (see peak_rss).
+
+        :param interval: float
+            Number of seconds between two samples.
+        """
+        self.interval = interval
+        self.start_rss = 0
+        self.max_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.max_rss = max(self.max_rss, current_rss())
+
+    def __enter__(self):
+        self.start_rss = self.max_rss = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        self.max_rss = max(self.max_rss, current_rss())
+        return False
+
+    @property
+    def peak(self):
+        """
+        :return: int
+            The peak resident set size sampled while the block ran, above the one it started with, in bytes.
+        """
+        return self.max_rss - self.start_rss
+
+
+# Instrumentation shared by all pipeline stages; disabled until enable_instrumentation is called
+INSTRUMENTATION = Instrumentation()
+
+
+def enable_instrumentation(progress_interval: float = 1.0):
+    """
+    Enables the shared instrumentation and restarts its run report.
+
+    :param progress_interval: float
+        Minimum number of seconds between two progress lines of the same task.
+    :return: Instrumentation
+    """
+    INSTRUMENTATION.enabled = True
+    INSTRUMENTATION.progress_interval = progress_interval
+    INSTRUMENTATION.reset()
+    return INSTRUMENTATION
+
+
+def stage(name: str):
+    """
+    Opens a stage of the shared instrumentation (see Instrumentation.stage).
+    """
+    return INSTRUMENTATION.stage(name)
+
+
+def count_bytes(read: int = 0, written: int = 0):
+    """
+    Counts bytes read and written in the current stage of the shared instrumentation.
+    """
+    INSTRUMENTATION.count_bytes(read, written)
+
+
+def progress(task: str, done: int, total: int = None):
+    """
+    Reports the progress of a task through the shared instrumentation (see Instrumentation.progress).
+    """
+    INSTRUMENTATION.progress(task, done, total)
@@ -0,0 +1,457 @@
+import numpy as np
+
+
+class Scene:
+    __slots__ = ('points', 'images', 'intrinsics', '_lookups')
+
+    def __init__(self, points, images, intrinsics=None):
+        """
+        Initializes the Scene with columnar points, images and (optionally) camera intrinsics.
+
+        All attributes are stored as contiguous arrays; ragged data (tracks and 2D points) use CSR layouts, so stages
+        work on slices of the arrays instead of per-point or per-image Python objects.
+
+        :param points: dict
+            A dictionary of point arrays (see COLMAPLoader.load_points3D_columnar).
+        :param images: dict
+            A dictionary of image arrays (see COLMAPLoader.load_images_columnar).
+        :param intrinsics: dict
+            A dictionary of camera intrinsics arrays (see COLMAPLoader.load_cameras_columnar), or None when the
+            intrinsics are unknown. They are not named "cameras", which is the scene key of the images.
+        """
+        self.points = points
+        self.images = images
+        self.intrinsics = intrinsics
+        self._lookups = {}
+
+    @classmethod
+    def from_dict(cls, scene):
+        """
+        Builds a Scene from a scene dictionary, either keyed by id or in columnar form.
+
+        :param scene: dict or Scene
+            A dictionary with "points" and "cameras" entries (as returned by COLMAPLoader.load_scene), or a Scene,
+            which is returned as is.
+        :return: Scene
+        """
+        if isinstance(scene, Scene):
+            return scene
+
+        points = scene['points']
+        images = scene['cameras']
+        return cls(points if is_columnar(points) else points3D_to_columnar(points),
+                   images if is_columnar(images) else images_to_columnar(images),
+                   scene.get('intrinsics'))
+
+    def to_dict(self):
+        """
+        Builds the scene dictionary keyed by id used by the original pipeline.
+
+        :return: dict
+            A dictionary containing:
+            - "points": A dictionary of 3D points
+            - "cameras": A dictionary of camera and image information
+        """
+        return {
+            "points": points3D_to_dict(self.points),
+            "cameras": images_to_dict(self.images)
+        }
+
+    def __getitem__(self, key: str):
+        """
+        Gives dictionary-style access to the scene, so a Scene can stand in for a columnar scene dictionary.
+
+        :param key: str
+            "points" for the point arrays, "cameras" for the image arrays (the name used throughout the pipeline),
+            or "intrinsics" for the camera intrinsics arrays.
+        """
+        if key == 'points':
+            return self.points
+        elif key == 'cameras':
+            return self.images
+        elif key == 'intrinsics':
+            return self.intrinsics
+        raise KeyError(key)
+
+    @property
+    def num_points(self):
+        return len(self.points['ids'])
+
+    @property
+    def num_images(self):
+        return len(self.images['ids'])
+
+    @property
+    def num_intrinsics(self):
+        return 0 if self.intrinsics is None else len(self.intrinsics['ids'])
+
+    def _rows(self, block_name: str, block, ids):
+        """
+        Maps ids to row positions through a sorted index built once per block.
+
+        :return: numpy.ndarray
+            The row of every id, or -1 for unknown ids.
+        """
+        if block_name not in self._lookups:
+            block_ids = np.asarray(block['ids'], dtype=np.int64)
+            order = np.argsort(block_ids, kind='stable')
+            self._lookups[block_name] = (block_ids[order], order)
+        sorted_ids, order = self._lookups[block_name]
+
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(sorted_ids) == 0:
+            return np.full(ids.shape, -1, dtype=np.int64)
+
+        positions = np.searchsorted(sorted_ids, ids)
+        positions[positions == len(sorted_ids)] = 0
+        return np.where(sorted_ids[positions] == ids, order[positions], -1)
+
+    def point_rows(self, point_ids):
+        """
+        :param point_ids: Array of point3D_ids.
+        :return: numpy.ndarray
+            The row of every point, or -1 for unknown ids.
+        """
+        return self._rows('points', self.points, point_ids)
+
+    def image_rows(self, image_ids):
+        """
+        :param image_ids: Array of image_ids.
+        :return: numpy.ndarray
+            The row of every image, or -1 for unknown ids.
+        """
+        return self._rows('images', self.images, image_ids)
+
+    def camera_rows(self, camera_ids):
+        """
+        :param camera_ids: Array of camera_ids.
+        :return: numpy.ndarray
+            The row of every camera, or -1 for unknown ids (or when the intrinsics are unknown).
+        """
+        if self.intrinsics is None:
+            return np.full(np.shape(camera_ids), -1, dtype=np.int64)
+        return self._rows('intrinsics', self.intrinsics, camera_ids)
+
+    def take(self, point_rows, image_rows):
+        """
+        Extracts a sub-scene with the given points and images, and the intrinsics of the cameras those images use.
+
+        The arrays are copied; see view for a sub-scene that only stores the row positions.
+
+        :param point_rows: Row positions of the points to keep, in the order to keep them.
+        :param image_rows: Row positions of the images to keep, in the order to keep them.
+        :return: Scene
+        """
+        images = take_images(self.images, image_rows)
+        return Scene(take_points(self.points, point_rows), images, self.intrinsics_for(images['camera_id']))
+
+    def view(self, point_rows, image_rows):
+        """
+        Creates a sub-scene view with the given points and images, without copying any array.
+
+        :param point_rows: Row positions of the points to keep, in the order to keep them.
+        :param image_rows: Row positions of the images to keep, in the order to keep them.
+        :return: SceneView
+        """
+        return SceneView(self, point_rows, image_rows)
+
+    def intrinsics_for(self, camera_ids):
+        """
+        Extracts the intrinsics of the given cameras.
+
+        :param camera_ids: Array of camera_ids (duplicates allowed).
+        :return: dict
+            A dictionary of camera intrinsics arrays with one row per distinct known camera_id, or None when the
+            intrinsics are unknown.
+        """
+        if self.intrinsics is None:
+            return None
+
+        camera_rows = self.camera_rows(np.unique(np.asarray(camera_ids)))
+        return {key: values[camera_rows[camera_rows >= 0]] for key, values in self.intrinsics.items()}
+
+
+class BlockView:
+    __slots__ = ('block', 'rows', 'offsets_key', 'element_keys', '_ragged')
+
+    def __init__(self, block, rows, offsets_key: str, element_keys):
+        """
+        Initializes the BlockView, a lazy selection of rows of a columnar block ("points" or "cameras").
+
+        Columns are sliced from the parent block only when they are accessed, so holding a view costs no more than its
+        row positions.
+
+        :param block: dict
+            The columnar block of the parent scene.
+        :param rows: numpy.ndarray
+            Row positions of the selected entries, in order.
+        :param offsets_key: str
+            Key of the CSR offsets of the block's ragged columns (e.g., "track_offsets").
+        :param element_keys: tuple
+            Keys of the block's ragged columns (e.g., ("track_image_ids", "track_point2d_idxs")).
+        """
+        self.block = block
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.offsets_key = offsets_key
+        self.element_keys = element_keys
+        self._ragged = None
+
+    def _ragged_layout(self):
+        if self._ragged is None:
+            self._ragged = take_ragged(self.block[self.offsets_key], self.rows)
+        return self._ragged
+
+    def __getitem__(self, key: str):
+        if key == self.offsets_key:
+            return self._ragged_layout()[1]
+        elif key in self.element_keys:
+            return self.block[key][self._ragged_layout()[0]]
+
+        values = self.block[key]
+        if isinstance(values, list):
+            return [values[row] for row in self.rows.tolist()]
+        return values[self.rows]
+
+    def __contains__(self, key: str):
+        return key in self.block
+
+    def __len__(self):
+        return len(self.rows)
+
+    def keys(self):
+        return self.block.keys()
+
+
+class SceneView:
+    __slots__ = ('parent', 'point_rows', 'image_rows', 'points', 'images')
+
+    def __init__(self, parent, point_rows, image_rows):
+        """
+        Initializes the SceneView, a sub-scene of a Scene described only by row positions into its arrays.
+
+        It offers the same dictionary-style access as a Scene; accessed columns are sliced from the parent on demand.
+        The point and image views are built once, so the ragged layouts they compute are reused by every access.
+
+        :param parent: Scene
+            The scene the rows refer to.
+        :param point_rows: numpy.ndarray
+            Row positions of the points of the sub-scene.
+        :param image_rows: numpy.ndarray
+            Row positions of the images of the sub-scene.
+        """
+        self.parent = parent
+        self.point_rows = np.asarray(point_rows, dtype=np.int64)
+        self.image_rows = np.asarray(image_rows, dtype=np.int64)
+        self.points = BlockView(parent.points, self.point_rows, 'track_offsets',
+                                ('track_image_ids', 'track_point2d_idxs'))
+        self.images = BlockView(parent.images, self.image_rows, 'point2d_offsets', ('xys', 'point3d_ids'))
+
+    @property
+    def intrinsics(self):
+        return self.parent.intrinsics_for(self.parent.images['camera_id'][self.image_rows])
+
+    def __getitem__(self, key: str):
+        """
+        Gives the same dictionary-style access as Scene.__getitem__.
+        """
+        if key == 'points':
+            return self.points
+        elif key == 'cameras':
+            return self.images
+        elif key == 'intrinsics':
+            return self.intrinsics
+        raise KeyError(key)
+
+    @property
+    def num_points(self):
+        return len(self.point_rows)
+
+    @property
+    def num_images(self):
+        return len(self.image_rows)
+
+    def materialize(self):
+        """
+        Copies the selected rows into a standalone Scene.
+
+        :return: Scene
+        """
+        return self.parent.take(self.point_rows, self.image_rows)
+
+
+def points3D_to_dict(points):
+    """
+    Builds the per-point dictionary view of columnar 3D points.
+
+    :param points: A dictionary of point arrays as returned by COLMAPLoader.load_points3D_columnar.
+    :return: A dictionary where keys are point3D_ids and values are dictionaries containing
+             point coordinates (xyz), RGB color values, reprojection error, and track information.
+    """
+    xyz = points['xyz']
+    rgb = points['rgb']
+    errors = points['error'].tolist()
+    offsets = points['track_offsets'].tolist()
+    image_ids = points['track_image_ids'].tolist()
+    point2d_idxs = points['track_point2d_idxs'].tolist()
+
+    points3D = {}
+    for i, point3d_id in enumerate(points['ids'].tolist()):
+        start, end = offsets[i], offsets[i + 1]
+        points3D[point3d_id] = {
+            "xyz": xyz[i],
+            "rgb": rgb[i],
+            "error": errors[i],
+            "track": list(zip(image_ids[start:end], point2d_idxs[start:end]))
+        }
+
+    return points3D
+
+
+def points3D_to_columnar(points3D):
+    """
+    Converts 3D points keyed by point3D_id into columnar form (the inverse of points3D_to_dict).
+
+    :param points3D: A dictionary where keys are point3D_ids and values are dictionaries containing
+                     point coordinates (xyz), RGB color values, reprojection error, and track information.
+    :return: A dictionary of point arrays (see COLMAPLoader.load_points3D_columnar).
+    """
+    values = list(points3D.values())
+    track_offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(np.array([len(point['track']) for point in values], dtype=np.int64), out=track_offsets[1:])
+    tracks = np.array([element for point in values for element in point['track']], dtype=np.uint32).reshape(-1, 2)
+
+    return {
+        "ids": np.array(list(points3D.keys()), dtype=np.uint64),
+        "xyz": np.array([point['xyz'] for point in values], dtype=np.float64).reshape(-1, 3),
+        "rgb": np.array([point['rgb'] for point in values], dtype=np.uint8).reshape(-1, 3),
+        "error": np.array([point['error'] for point in values], dtype=np.float64),
+        "track_offsets": track_offsets,
+        "track_image_ids": np.ascontiguousarray(tracks[:, 0]),
+        "track_point2d_idxs": np.ascontiguousarray(tracks[:, 1])
+    }
+
+
+def images_to_dict(images):
+    """
+    Builds the per-image dictionary view of columnar images.
+
+    :param images: A dictionary of image arrays as returned by COLMAPLoader.load_images_columnar.
+    :return: A dictionary where keys are image_ids and values are dictionaries containing
+             quaternion (qvec), translation vector (tvec), camera_id, image name, 2D points coordinates (xys),
+             and associated 3D point ids (point3d_ids).
+    """
+    offsets = images['point2d_offsets'].tolist()
+    camera_ids = images['camera_id'].tolist()
+
+    result = {}
+    for i, image_id in enumerate(images['ids'].tolist()):
+        start, end = offsets[i], offsets[i + 1]
+        result[image_id] = {
+            "qvec": images['qvec'][i],
+            "tvec": images['tvec'][i],
+            "camera_id": camera_ids[i],
+            "name": images['name'][i],
+            "xys": images['xys'][start:end],
+            "point3d_ids": images['point3d_ids'][start:end]
+        }
+
+    return result
+
+
+def images_to_columnar(images):
+    """
+    Converts images keyed by image_id into columnar form (the inverse of images_to_dict).
+
+    :param images: A dictionary where keys are image_ids and values are dictionaries containing
+                   quaternion (qvec), translation vector (tvec), camera_id, image name, 2D points coordinates (xys),
+                   and associated 3D point ids (point3d_ids).
+    :return: A dictionary of image arrays (see COLMAPLoader.load_images_columnar).
+    """
+    values = list(images.values())
+    point2d_offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(np.array([len(image['point3d_ids']) for image in values], dtype=np.int64), out=point2d_offsets[1:])
+
+    if values:
+        xys = np.concatenate([np.asarray(image['xys'], dtype=np.float64).reshape(-1, 2) for image in values])
+        point3d_ids = np.concatenate([np.asarray(image['point3d_ids'], dtype=np.int64) for image in values])
+    else:
+        xys = np.empty((0, 2), dtype=np.float64)
+        point3d_ids = np.empty(0, dtype=np.int64)
+
+    return {
+        "ids": np.array(list(images.keys()), dtype=np.uint32),
+        "qvec": np.array([image['qvec'] for image in values], dtype=np.float64).reshape(-1, 4),
+        "tvec": np.array([image['tvec'] for image in values], dtype=np.float64).reshape(-1, 3),
+        "camera_id": np.array([image['camera_id'] for image in values], dtype=np.uint32),
+        "name": [image['name'] for image in values],
+        "point2d_offsets": point2d_offsets,
+        "xys": xys,
+        "point3d_ids": point3d_ids
+    }
+
+
+def is_columnar(block):
+    """
+    Tells whether a scene block ("points" or "cameras") is in columnar form rather than a dictionary keyed by id.
+
+    :param block: The "points" or "cameras" entry of a scene.
+    :return: True if the block is a dictionary of arrays.
+    """
+    return "ids" in block
+
+
+def take_ragged(offsets, rows):
+    """
+    Computes the element indices and the new offsets of a subset of rows of a CSR layout.
+
+    :param offsets: (N + 1,) offsets of the CSR layout.
+    :param rows: Indices of the rows to take.
+    :return: Tuple of (element indices, new offsets).
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    lengths = offsets[rows + 1] - offsets[rows]
+    new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    elements = np.repeat(offsets[rows] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1], dtype=np.int64)
+    return elements, new_offsets
+
+
+def take_points(points, rows):
+    """
+    Extracts a subset of columnar 3D points.
+
+    :param points: A dictionary of point arrays.
+    :param rows: Indices (row positions, not point3D_ids) of the points to take.
+    :return: A dictionary of point arrays containing only the selected points, in the given order.
+    """
+    elements, track_offsets = take_ragged(points['track_offsets'], rows)
+    return {
+        "ids": points['ids'][rows],
+        "xyz": points['xyz'][rows],
+        "rgb": points['rgb'][rows],
+        "error": points['error'][rows],
+        "track_offsets": track_offsets,
+        "track_image_ids": points['track_image_ids'][elements],
+        "track_point2d_idxs": points['track_point2d_idxs'][elements]
+    }
+
+
+def take_images(images, rows):
+    """
+    Extracts a subset of columnar images.
+
+    :param images: A dictionary of image arrays.
+    :param rows: Indices (row positions, not image_ids) of the images to take.
+    :return: A dictionary of image arrays containing only the selected images, in the given order.
+    """
+    elements, point2d_offsets = take_ragged(images['point2d_offsets'], rows)
+    return {
+        "ids": images['ids'][rows],
+        "qvec": images['qvec'][rows],
+        "tvec": images['tvec'][rows],
+        "camera_id": images['camera_id'][rows],
+        "name": [images['name'][row] for row in rows],
+        "point2d_offsets": point2d_offsets,
+        "xys": images['xys'][elements],
+        "point3d_ids": images['point3d_ids'][elements]
+    }
@@ -0,0 +1,227 @@
+import numpy as np
+
+from src.common.cell_index import CellIndex
+from src.common.scene import Scene, SceneView, is_columnar
+
+# Strategies of subsample_points
+SUBSAMPLING_STRATEGIES = ('voxel', 'cell', 'error')
+
+# Default preview budget, in points
+PREVIEW_POINTS = 200_000
+
+
+def voxel_subsample(xyz, budget: int, seed: int = 0, iterations: int = 10):
+    """
+    Keeps one point per occupied voxel of a regular 3D grid, so dense regions are thinned while sparse ones are kept.
+
+    The voxel size is searched for so that about budget voxels are occupied; when more remain, the voxels whose
+    representative comes first in a seeded random order are kept.
+
+    :param xyz: numpy.ndarray
+        The (N, 3) point coordinates.
+    :param budget: int
+        Maximum number of points to keep.
+    :param seed: int
+        Seed of the random order picking the representative of every voxel.
+    :param iterations: int
+        Maximum number of voxel size refinements.
+    :return: numpy.ndarray
+        Sorted row positions of the kept points.
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    low = xyz.min(axis=0)
+    extent = np.maximum(xyz.max(axis=0) - low, 1e-9)
+    order = np.random.default_rng(seed).permutation(len(xyz))
+    shuffled = xyz[order] - low
+
+    # Start from cubic voxels filling the bounding box with budget voxels
+    size = float(np.cbrt(np.prod(extent) / budget))
+    previous = None
+    exponent = 2.0  # Occupancy of a scan grows roughly with the inverse square of the voxel size (surfaces)
+    for _ in range(iterations):
+        dims = np.floor(extent / size).astype(np.int64) + 1
+        if float(np.prod(dims.astype(np.float64))) >= 2 ** 62:
+            size *= 2
+            continue
+
+        voxels = np.floor(shuffled * (1.0 / size)).astype(np.int64)
+        keys = (voxels[:, 0] * dims[1] + voxels[:, 1]) * dims[2] + voxels[:, 2]
+        _, first = np.unique(keys, return_index=True)
+        if budget <= len(first) <= 2 * budget:
+            break
+
+        # Refine the growth exponent from the last two sizes, then aim for 1.5 * budget occupied voxels
+        if previous is not None and previous[0] != size and previous[1] != len(first):
+            exponent = float(np.clip(np.log(len(first) / previous[1]) / np.log(previous[0] / size), 0.5, 3.0))
+        previous = (size, len(first))
+        size *= float(np.clip((len(first) / (1.5 * budget)) ** (1.0 / exponent), 0.1, 10.0))
+
+    # Representatives are the first points of every voxel in the random order; keep the earliest ones
+    first = np.sort(first)[:budget]
+    return np.sort(order[first])
+
+
+def cell_subsample(xyz, budget: int, cells: CellIndex = None, seed: int = 0, grid: int = 16):
+    """
+    Splits the budget evenly over the cells of the ground plane, so sparse cells keep all their points while dense
+    ones are sampled down. Budget left over by sparse cells goes to the denser ones.
+
+    :param xyz: numpy.ndarray
+        The (N, 3) point coordinates.
+    :param budget: int
+        Maximum number of points to keep.
+    :param cells: CellIndex
+        The cells (strata) on the X/Z ground plane. Points outside every cell form one more stratum. Defaults to a
+        grid x grid uniform grid over the bounding box.
+    :param seed: int
+        Seed of the random sampling within every cell.
+    :param grid: int
+        Number of rows and columns of the default grid.
+    :return: numpy.ndarray
+        Sorted row positions of the kept points.
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    if cells is None:
+        low = xyz[:, [0, 2]].min(axis=0)
+        high = xyz[:, [0, 2]].max(axis=0)
+        x_edges = np.linspace(low[0], high[0], grid + 1)
+        z_edges = np.linspace(low[1], high[1], grid + 1)
+        x_edges[-1] = z_edges[-1] = np.inf
+        cells = CellIndex(x_edges, z_edges, np.arange(grid * grid).reshape(grid, grid),
+                          [(row, col) for row in range(grid) for col in range(grid)])
+
+    strata = cells.locate(xyz[:, 0], xyz[:, 2]) + 1
+    counts = np.bincount(strata, minlength=len(cells) + 1)
+
+    # Water-filling: every stratum gets min(count, level), with the highest level fitting the budget
+    sorted_counts = np.sort(counts)
+    taken = np.concatenate(([0], np.cumsum(sorted_counts)[:-1]))
+    filled = taken + sorted_counts * np.arange(len(counts), 0, -1)
+    fits = int(np.searchsorted(filled, budget, side='right'))
+    if fits == len(counts):
+        level = sorted_counts[-1]
+    else:
+        level = (budget - taken[fits]) // (len(counts) - fits)
+    quotas = np.minimum(counts, level)
+
+    # Hand out what the integer level leaves of the budget, one point per stratum still above it
+    remainder = max(int(budget - quotas.sum()), 0)
+    quotas[np.flatnonzero(counts > level)[:remainder]] += 1
+
+    # Rank the points of every stratum in a seeded random order and keep the first quota of them
+    priority = np.random.default_rng(seed).permutation(len(xyz))
+    order = np.lexsort((priority, strata))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ranks = np.arange(len(xyz)) - np.repeat(starts, counts)
+    return np.sort(order[ranks < quotas[strata[order]]])
+
+
+def error_subsample(error, budget: int, seed: int = 0):
+    """
+    Samples points without replacement with probabilities inversely proportional to their reprojection error, so
+    well-constrained points are favored.
+
+    :param error: numpy.ndarray
+        The reprojection error of every point.
+    :param budget: int
+        Number of points to keep.
+    :param seed: int
+        Seed of the weighted sampling.
+    :return: numpy.ndarray
+        Sorted row positions of the kept points.
+    """
+    error = np.asarray(error, dtype=np.float64)
+    weights = 1.0 / (error + max(float(np.median(error)) * 0.1, 1e-6))
+
+    # Weighted sampling without replacement: keep the largest log(u) / w keys (Efraimidis-Spirakis)
+    keys = np.log(np.random.default_rng(seed).random(len(error))) / weights
+    return np.sort(np.argpartition(-keys, budget - 1)[:budget])
+
+
+def subsample_points(points, budget: int = PREVIEW_POINTS, strategy: str = 'voxel', cells: CellIndex = None,
+                     seed: int = 0):
+    """
+    Selects a deterministic, fixed-budget preview subset of the points of a scene.
+
+    :param points: dict
+        The columnar points of a scene (see COLMAPLoader.load_points3D_columnar), or a BlockView of them.
+    :param budget: int
+        Maximum number of points to keep.
+    :param strategy: str
+        'voxel' (one point per voxel, see voxel_subsample), 'cell' (even share per ground plane cell, see
+        cell_subsample) or 'error' (weighted by inverse reprojection error, see error_subsample).
+    :param cells: CellIndex
+        The cells of the 'cell' strategy.
+    :param seed: int
+        Seed of the random choices, so the preview is reproducible.
+    :return: numpy.ndarray
+        Sorted row positions of the kept points; every row when the scene fits the budget.
+    """
+    if strategy not in SUBSAMPLING_STRATEGIES:
+        raise ValueError(f"Unknown subsampling strategy {strategy!r}, expected one of {SUBSAMPLING_STRATEGIES}")
+
+    num_points = len(points['ids'])
+    if num_points <= budget:
+        return np.arange(num_points)
+
+    if strategy == 'voxel':
+        return voxel_subsample(points['xyz'], budget, seed)
+    elif strategy == 'cell':
+        return cell_subsample(points['xyz'], budget, cells, seed)
+    return error_subsample(points['error'], budget, seed)
+
+
+def preview_scene(scene, budget: int = PREVIEW_POINTS, strategy: str = 'voxel', rows=None):
+    """
+    Builds a preview of a scene holding a subset of its points and all of its cameras.
+
+    :param scene: dict or Scene
+        A scene dictionary (keyed by id or columnar), a Scene or a SceneView.
+    :param budget: int
+        Maximum number of points of the preview.
+    :param strategy: str
+        The subsampling strategy (see subsample_points).
+    :param rows: numpy.ndarray
+        Precomputed point rows of the preview (e.g., from COLMAPLoader.load_preview), used instead of subsampling.
+    :return: SceneView
+        A view of the scene holding the preview points.
+    """
+    if isinstance(scene, SceneView):
+        parent, point_rows, image_rows = scene.parent, scene.point_rows, scene.image_rows
+        points = scene.points
+    else:
+        parent = Scene.from_dict(scene)
+        point_rows, image_rows = np.arange(parent.num_points), np.arange(parent.num_images)
+        points = parent.points
+
+    if rows is None:
+        rows = subsample_points(points, budget, strategy)
+
+    return SceneView(parent, point_rows[rows], image_rows)
+
+
+def preview_xyz(points, budget: int = PREVIEW_POINTS, strategy: str = 'voxel'):
+    """
+    Extracts the coordinates of a preview subset of points, for plotting and projection.
+
+    :param points: dict
+        Points keyed by id, or in columnar form.
+    :param budget: int
+        Maximum number of points to return, or None for all of them.
+    :param strategy: str
+        The subsampling strategy (see subsample_points).
+    :return: numpy.ndarray
+        The (N, 3) coordinates of the preview points.
+    """
+    if not is_columnar(points):
+        # Only the columns used by the subsampling strategies are extracted
+        points = {
+            "ids": np.array(list(points.keys())),
+            "xyz": np.array([point['xyz'] for point in points.values()]).reshape(-1, 3),
+            "error": np.array([point['error'] for point in points.values()], dtype=np.float64)
+        }
+
+    xyz = np.asarray(points['xyz'])
+    if budget is None:
+        return xyz
+    return xyz[subsample_points(points, budget, strategy)]
@@ -2,3 +2,4 @@
 from .splat_loader import SplatLoader
 from .splat_merger import SplatMerger
 from .splat_exporter import SplatExporter
+from .ply_schema import PlySchema
@@ -0,0 +1,171 @@
+import numpy as np
+
+# PLY scalar property types and their NumPy equivalents
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2',
+    'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4',
+    'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4',
+    'double': 'f8', 'float64': 'f8'
+}
+
+# Canonical PLY name of every NumPy scalar type
+NUMPY_TO_PLY = {
+    'i1': 'char', 'u1': 'uchar',
+    'i2': 'short', 'u2': 'ushort',
+    'i4': 'int', 'u4': 'uint',
+    'f4': 'float', 'f8': 'double'
+}
+
+# PLY binary formats and their byte order
+PLY_BYTE_ORDERS = {
+    'binary_little_endian': '<',
+    'binary_big_endian': '>'
+}
+
+
+class PlySchema:
+    def __init__(self, properties, byte_order: str = '<'):
+        """
+        Initializes the PlySchema describing the vertex records of a binary .ply file.
+
+        :param properties: list
+            A list of (name, PLY type) pairs, in file order (e.g., [('x', 'float'), ...]).
+        :param byte_order: str
+            '<' for binary_little_endian or '>' for binary_big_endian.
+        """
+        for name, ply_type in properties:
+            if ply_type not in PLY_TYPES:
+                raise ValueError(f"Unsupported PLY property type for {name}: {ply_type}")
+        if byte_order not in PLY_BYTE_ORDERS.values():
+            raise ValueError(f"Unsupported byte order: {byte_order}")
+
+        self.properties = list(properties)
+        self.byte_order = byte_order
+
+    @property
+    def dtype(self):
+        """
+        :return: numpy.dtype
+            The structured dtype of a vertex record.
+        """
+        return np.dtype([(name, self.byte_order + PLY_TYPES[ply_type]) for name, ply_type in self.properties])
+
+    @property
+    def names(self):
+        """
+        :return: list
+            The property names, in file order.
+        """
+        return [name for name, _ in self.properties]
+
+    @classmethod
+    def from_dtype(cls, dtype):
+        """
+        Builds the schema matching a structured vertex dtype.
+
+        :param dtype: numpy.dtype
+            A structured dtype with one scalar field per property.
+        :return: PlySchema
+        """
+        properties = []
+        byte_order = '<'
+        for name in dtype.names:
+            field = dtype.fields[name][0]
+            key = field.kind + str(field.itemsize)
+            if field.shape or key not in NUMPY_TO_PLY:
+                raise ValueError(f"Field {name} of type {field} cannot be stored as a PLY property")
+            if field.byteorder == '>' or (field.byteorder == '=' and not np.little_endian):
+                byte_order = '>'
+            properties.append((name, NUMPY_TO_PLY[key]))
+
+        return cls(properties, byte_order)
+
+    @classmethod
+    def gaussian(cls, sh_degree: int = 3, normals: bool = True, extra=()):
+        """
+        Builds the schema of a Gaussian Splatting model with float32 properties.
+
+        :param sh_degree: int
+            Degree of the spherical harmonics; the model has 3 * ((sh_degree + 1) ** 2 - 1) f_rest properties.
+        :param normals: bool
+            Whether the nx, ny and nz properties are present.
+        :param extra: iterable
+            Names of additional float properties, appended after the rotation.
+        :return: PlySchema
+        """
+        num_rest = 3 * ((sh_degree + 1) ** 2 - 1)
+        names = ['x', 'y', 'z']
+        if normals:
+            names += ['nx', 'ny', 'nz']
+        names += [f'f_dc_{i}' for i in range(3)]
+        names += [f'f_rest_{i}' for i in range(num_rest)]
+        names += ['opacity']
+        names += [f'scale_{i}' for i in range(3)]
+        names += [f'rot_{i}' for i in range(4)]
+        names += list(extra)
+
+        return cls([(name, 'float') for name in names])
+
+    @classmethod
+    def read_header(cls, ply_file):
+        """
+        Parses the header of a binary .ply file containing a single vertex element.
+
+        :param ply_file: A binary file object positioned at the start of the file.
+        :return: tuple
+            The number of vertices and the PlySchema of a vertex record. The file is left positioned at the start of
+            the vertex data.
+        """
+        if ply_file.readline().strip() != b'ply':
+            raise ValueError("Not a PLY file")
+
+        byte_order = None
+        num_vertices = None
+        properties = []
+        while True:
+            line = ply_file.readline()
+            if not line:
+                raise ValueError("Unexpected end of file while reading the PLY header")
+
+            tokens = line.decode('utf-8').split()
+            if not tokens or tokens[0] in ('comment', 'obj_info'):
+                continue
+
+            if tokens[0] == 'end_header':
+                break
+            elif tokens[0] == 'format':
+                if tokens[1] not in PLY_BYTE_ORDERS:
+                    raise ValueError(f"Unsupported PLY format: {tokens[1]}")
+                byte_order = PLY_BYTE_ORDERS[tokens[1]]
+            elif tokens[0] == 'element':
+                if tokens[1] != 'vertex':
+                    raise ValueError(f"Unsupported PLY element: {tokens[1]}")
+                num_vertices = int(tokens[2])
+            elif tokens[0] == 'property':
+                if tokens[1] == 'list' or tokens[1] not in PLY_TYPES:
+                    raise ValueError(f"Unsupported PLY property: {' '.join(tokens[1:])}")
+                properties.append((tokens[2], tokens[1]))
+
+        if byte_order is None or num_vertices is None:
+            raise ValueError("PLY header is missing the format or the vertex element")
+
+        return num_vertices, cls(properties, byte_order)
+
+    def header(self, num_vertices: int):
+        """
+        Builds the header of a binary .ply file holding vertices of this schema.
+
+        :param num_vertices: int
+            The number of vertices in the file.
+        :return: bytes
+        """
+        format_name = next(name for name, order in PLY_BYTE_ORDERS.items() if order == self.byte_order)
+        lines = ['ply', f'format {format_name} 1.0', f'element vertex {num_vertices}']
+        lines += [f'property {ply_type} {name}' for name, ply_type in self.properties]
+        lines.append('end_header')
+
+        return ('\n'.join(lines) + '\n').encode('utf-8')
@@ -1,4 +1,8 @@
-import struct
+import numpy as np
+
+from src.common.instrumentation import stage, count_bytes
+from src.merge.ply_schema import PlySchema
+from src.merge.splat_loader import dicts_to_splats
 
 
 class SplatExporter:
@@ -6,8 +10,9 @@ class SplatExporter:
         """
         Initializes the SplatExporter with the splat list and the output path
 
-        :param splat: list
-            A list containing all the Gaussian primitives of the complete large scale scene
+        :param splat: list or numpy.ndarray or iterable
+            A list containing all the Gaussian primitives of the complete large scale scene, or a structured array of
+            them (see SplatLoader.read_ply). For export_splat_stream, an iterable of structured arrays instead
         :param output_path: str
             A string containing the output directory path to save the mesh of the complete scene
         """
@@ -16,52 +21,57 @@ class SplatExporter:
 
     def export_splat(self):
         """
-        Exports the Gaussian splat list into a .ply file following the specified format.
+        Exports the Gaussian splats into a .ply file following the specified format.
+
+        The header is generated from the same PlySchema as the packed records, so both always agree whatever the SH
+        degree or extra attributes of the splats.
         """
         print(f"Exporting {len(self.splat)} splats to {self.output_path}")
+
+        # Bring the splats to a structured array of vertex records
+        vertices = self.splat if isinstance(self.splat, np.ndarray) else dicts_to_splats(self.splat)
+        schema = PlySchema.from_dtype(vertices.dtype)
+
         # Create and open the file in binary write mode
+        with stage('export_splat'), open(self.output_path, 'wb') as ply_file:
+            # Write the header
+            ply_file.write(schema.header(len(vertices)))
+
+            # Write the binary content of all Gaussian splats
+            np.ascontiguousarray(vertices).tofile(ply_file)
+            count_bytes(written=ply_file.tell())
+
+    def export_splat_stream(self, num_vertices: int, dtype):
+        """
+        Exports the Gaussian splats into a .ply file chunk by chunk, holding only one chunk in memory at a time.
+
+        Since the header comes first, the total number of vertices has to be known before the chunks are produced.
+
+        :param num_vertices: int
+            The total number of Gaussians in all chunks.
+        :param dtype: numpy.dtype
+            The structured dtype shared by all chunks.
+        :return: int
+            The number of Gaussians written.
+        """
+        print(f"Streaming {num_vertices} splats to {self.output_path}")
+        schema = PlySchema.from_dtype(dtype)
+
+        written = 0
         with open(self.output_path, 'wb') as ply_file:
             # Write the header
-            ply_file.write(b'ply\n')
-            ply_file.write(b'format binary_little_endian 1.0\n')
-            ply_file.write(f'element vertex {len(self.splat)}\n'.encode('utf-8'))
-            ply_file.write(b'property float x\n')
-            ply_file.write(b'property float y\n')
-            ply_file.write(b'property float z\n')
-            ply_file.write(b'property float nx\n')
-            ply_file.write(b'property float ny\n')
-            ply_file.write(b'property float nz\n')
-            ply_file.write(b'property float f_dc_0\n')
-            ply_file.write(b'property float f_dc_1\n')
-            ply_file.write(b'property float f_dc_2\n')
-            for i in range(45):  # Writing f_rest properties
-                ply_file.write(f'property float f_rest_{i}\n'.encode('utf-8'))
-            ply_file.write(b'property float opacity\n')
-            ply_file.write(b'property float scale_0\n')
-            ply_file.write(b'property float scale_1\n')
-            ply_file.write(b'property float scale_2\n')
-            ply_file.write(b'property float rot_0\n')
-            ply_file.write(b'property float rot_1\n')
-            ply_file.write(b'property float rot_2\n')
-            ply_file.write(b'property float rot_3\n')
-            ply_file.write(b'end_header\n')
-
-            # Write the binary content for each Gaussian splat
-            for splat in self.splat:
-                # Define the format string to match the loaded data
-                format_str = '<fff fff 48f f fff ffff'
-
-                # Pack the splat data into binary format
-                packed_data = struct.pack(
-                    format_str,
-                    *splat['position'],  # x, y, z
-                    *splat['normal'],  # nx, ny, nz
-                    *splat['features_dc'],  # f_dc_0, f_dc_1, f_dc_2
-                    *splat['features_rest'],  # f_rest_0 to f_rest_47
-                    splat['opacity'],  # opacity
-                    *splat['scale'],  # scale_0, scale_1, scale_2
-                    *splat['rotation']  # rot_0, rot_1, rot_2, rot_3
-                )
-
-                # Write the packed binary data
-                ply_file.write(packed_data)
+            ply_file.write(schema.header(num_vertices))
+
+            # Append the binary content of every chunk
+            for chunk in self.splat:
+                if chunk.dtype != dtype:
+                    raise ValueError("All streamed chunks must share the dtype declared in the header")
+                np.ascontiguousarray(chunk).tofile(ply_file)
+                written += len(chunk)
+
+            count_bytes(written=ply_file.tell())
+
+        if written != num_vertices:
+            raise ValueError(f"Header declares {num_vertices} splats but {written} were written")
+
+        return written
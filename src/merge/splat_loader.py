@@ -1,5 +1,12 @@
-import struct
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.common.cell_index import CellIndex
+from src.common.cell_manifest import CellManifest, GROUND_AXES
+from src.common.instrumentation import stage, count_bytes, progress
+from src.merge.ply_schema import PlySchema
 
 
 class SplatLoader:
@@ -11,99 +18,302 @@ class SplatLoader:
         """
         self.dir_path = dir_path
 
-    def load_splats(self):
+    @staticmethod
+    def read_ply(file_path: str, mmap: bool = True):
         """
-        Loads the Gaussian Splatting results from all .ply files in the directory.
+        Reads the vertices of a binary .ply file into a structured array with one field per PLY property.
+
+        The record layout is built from the properties declared in the header (see PlySchema), so models of any SH
+        degree or with extra attributes are read as they are.
+
+        :param file_path: Path to the .ply file.
+        :param mmap: If True, the vertex data is memory-mapped instead of being read into memory.
+        :return: numpy.ndarray
+            A structured array (or memory map) of the vertex records.
+        """
+        with open(file_path, 'rb') as ply_file:
+            num_vertices, schema = PlySchema.read_header(ply_file)
+            dtype = schema.dtype
+            header_size = ply_file.tell()
+            count_bytes(read=num_vertices * dtype.itemsize)
+
+            if not mmap:
+                vertices = np.fromfile(ply_file, dtype=dtype, count=num_vertices)
+                if len(vertices) != num_vertices:
+                    raise ValueError(f"{file_path} holds {len(vertices)} of {num_vertices} vertices")
+                return vertices
+
+        if num_vertices == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode='r', offset=header_size, shape=(num_vertices,))
+
+    def list_splat_files(self):
+        """
+        Finds the .ply files of the split scenes in the directory.
 
         :return: dict
-            A dictionary containing the GS results of the split scenes, where the keys are the respective row and column
-            computed during splitting and the values are a list of splats
+            A dictionary where the keys are the row and column of each cell, parsed from the filename
+            (e.g., "1_2.ply"), and the values are the paths of the .ply files
         """
-        splats = {}
+        splat_files = {}
 
         # Iterate over all the .ply files in the directory
         for file_name in os.listdir(self.dir_path):
             # Check if the file is a .ply file
             if file_name.endswith('.ply'):
-                file_path = os.path.join(self.dir_path, file_name)
-                print(f"Found {file_name}")
-
                 # Extract the row and column information from the filename (e.g., "1_2.ply")
                 row, col = map(int, file_name.split('.')[0].split('_'))
-                print(f"Loading splats for cell: {row, col}...")
-
-                # Open the .ply file and read its contents
-                with open(file_path, 'rb') as ply_file:
-                    # Skip the header part
-                    while True:
-                        line = ply_file.readline().decode('utf-8').strip()
-                        if line == "end_header":
-                            break
-
-                    splat_data = []
-
-                    # Read until end of file
-                    while True:
-                        # Read the binary content for each vertex (assuming vertex data is 248 bytes per vertex)
-                        vertex_data = ply_file.read(248)
-                        if not vertex_data:
-                            break  # End of file
-
-                        # Unpack the binary data
-                        try:
-                            data = struct.unpack('<fff fff 48f f fff ffff', vertex_data)
-                            splat = {
-                                'position': data[:3],
-                                'normal': data[3:6],
-                                'features_dc': data[6:9],
-                                'features_rest': data[9:57],
-                                'opacity': data[57],
-                                'scale': data[58:61],
-                                'rotation': data[61:65]
-                            }
-                            splat_data.append(splat)
-                        except struct.error:
-                            print(f"Error unpacking vertex data from {file_name}")
-                            break
-
-                # Store the splat data in the dictionary using the (row, col) as keys
-                splats[(row, col)] = splat_data
+                splat_files[(row, col)] = os.path.join(self.dir_path, file_name)
+
+        return splat_files
+
+    def load_splats_columnar(self, mmap: bool = True):
+        """
+        Loads the Gaussian Splatting results from all .ply files in the directory as structured arrays.
+
+        :param mmap: If True, the vertex data is memory-mapped instead of being read into memory.
+        :return: dict
+            A dictionary containing the GS results of the split scenes, where the keys are the respective row and column
+            computed during splitting and the values are structured arrays of the splats (see splat_columns)
+        """
+        splats = {}
+
+        splat_files = self.list_splat_files()
+        with stage('load_splats'):
+            for (row, col), file_path in splat_files.items():
+                splats[(row, col)] = self.read_ply(file_path, mmap)
+                progress('Loading splats', len(splats), len(splat_files))
 
         print(f"Total cells loaded: {len(splats)}")
         return splats
 
+    def load_splats_parallel(self, workers: int = None, cells=None, axes=GROUND_AXES, mmap: bool = True):
+        """
+        Loads the Gaussian Splatting results from all .ply files in the directory concurrently.
+
+        Each worker thread decodes one file and, when cell boundaries are given, culls it right away so only the
+        surviving Gaussians are kept. The culling runs in NumPy, which releases the GIL, and the threads share the
+        decoded arrays directly, so no cell is copied between workers.
+
+        :param workers: Number of workers. Defaults to the number of CPUs.
+        :param cells: Optional dictionary of cell boundaries (see load_cells). Cells without boundaries are skipped.
+        :param axes: The two position axes compared against the cell boundaries (see SplatMerger).
+        :param mmap: If True, the vertex data is memory-mapped instead of being read into memory.
+        :return: dict
+            The same mapping as load_splats_columnar, with culled splats when cells are given
+        """
+        splat_files = self.list_splat_files()
+        if cells is not None:
+            for pos in [pos for pos in splat_files if pos not in cells]:
+                print(f"Warning: Cell boundaries for position {pos} not found.")
+                del splat_files[pos]
+
+        workers = workers if workers is not None else (os.cpu_count() or 1)
+        cell_index = CellIndex.from_cells(cells) if cells is not None else None
+        splats = {}
+        with stage('load_splats'):
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    pos: executor.submit(_load_cell_file, file_path, pos, cell_index, axes, mmap)
+                    for pos, file_path in splat_files.items()
+                }
+
+                for pos, future in futures.items():
+                    splats[pos] = future.result()
+                    progress('Loading splats', len(splats), len(futures))
+
+        print(f"Total cells loaded: {len(splats)}")
+        return splats
+
+    def load_splats(self):
+        """
+        Loads the Gaussian Splatting results from all .ply files in the directory.
+
+        :return: dict
+            A dictionary containing the GS results of the split scenes, where the keys are the respective row and column
+            computed during splitting and the values are a list of splats
+        """
+        return {pos: splats_to_dicts(vertices) for pos, vertices in self.load_splats_columnar().items()}
+
     @staticmethod
     def load_cells(filepath: str):
         """
-        Loads cell boundaries from the cell_boundaries.txt file.
+        Loads cell boundaries from a cells.json manifest or a legacy cell_boundaries.txt file.
 
-        :param filepath: Path to the cell_boundaries.txt file.
+        :param filepath: Path to the cells.json or cell_boundaries.txt file.
         :return: dict
             A dictionary where the keys are (row, col) tuples and the values are dictionaries with 'min' and 'max' keys
             containing the boundary points.
         """
-        cell_boundaries = {}
+        return CellManifest.load(filepath).boundaries()
+
+    @staticmethod
+    def load_cell_index(filepath: str):
+        """
+        Loads cell boundaries from a cells.json manifest or a cell_boundaries.txt file into a spatial index.
 
-        with open(filepath, 'r') as file:
-            while True:
-                line = file.readline().strip()
-                if not line:
-                    break
+        :param filepath: Path to the cells.json or cell_boundaries.txt file.
+        :return: CellIndex
+            An index answering batched point-to-cell and box-to-cells queries over the cells.
+        """
+        return CellIndex.from_cells(SplatLoader.load_cells(filepath))
 
-                # Parse the row and column
-                row, col = map(int, line.split())
 
-                # Parse the boundary points (min and max)
-                min_line = file.readline().strip()
-                max_line = file.readline().strip()
+def _indexed_fields(names, prefix: str):
+    """
+    Collects the fields named prefix + index, ordered by index.
 
-                min_x, min_z = map(float, min_line.split())
-                max_x, max_z = map(float, max_line.split())
+    :param names: Field names of a vertex dtype.
+    :param prefix: Common prefix of the fields (e.g., "f_rest_").
+    :return: list
+        The matching field names.
+    """
+    indexed = [name for name in names if name.startswith(prefix) and name[len(prefix):].isdigit()]
+    return sorted(indexed, key=lambda name: int(name[len(prefix):]))
 
-                # Store the boundary information in the dictionary
-                cell_boundaries[(row, col)] = {
-                    'min': [min_x, min_z],
-                    'max': [max_x, max_z]
-                }
 
-        return cell_boundaries
+def _field_block(vertices, names):
+    """
+    Returns the given fields of a structured array as an (N, len(names)) array.
+
+    When the fields are consecutive float32 values this is a view of the underlying buffer; otherwise the fields are
+    copied.
+
+    :param vertices: Structured array of vertex records.
+    :param names: Names of the fields to select.
+    :return: numpy.ndarray
+    """
+    fields = vertices.dtype.fields
+    first_offset = fields[names[0]][1] if names else 0
+    contiguous = all(fields[name][0] == np.dtype('<f4') and fields[name][1] == first_offset + 4 * i
+                     for i, name in enumerate(names))
+
+    if contiguous and vertices.dtype.itemsize % 4 == 0 and first_offset % 4 == 0:
+        floats = vertices.view(np.dtype('<f4')).reshape(len(vertices), vertices.dtype.itemsize // 4)
+        return floats[:, first_offset // 4:first_offset // 4 + len(names)]
+
+    block = np.empty((len(vertices), len(names)), dtype=np.float32)
+    for i, name in enumerate(names):
+        block[:, i] = vertices[name]
+    return block
+
+
+def splat_columns(vertices):
+    """
+    Gives column access to the Gaussian attributes of a structured array of splats.
+
+    :param vertices: Structured array of vertex records as returned by SplatLoader.read_ply.
+    :return: dict
+        A dictionary with the (N, k) arrays 'position', 'normal', 'features_dc', 'features_rest', 'scale' and
+        'rotation', and the (N,) array 'opacity'. Attributes missing from the file are left out.
+    """
+    names = vertices.dtype.names
+    groups = {
+        'position': [name for name in ('x', 'y', 'z') if name in names],
+        'normal': [name for name in ('nx', 'ny', 'nz') if name in names],
+        'features_dc': _indexed_fields(names, 'f_dc_'),
+        'features_rest': _indexed_fields(names, 'f_rest_'),
+        'opacity': ['opacity'] if 'opacity' in names else [],
+        'scale': _indexed_fields(names, 'scale_'),
+        'rotation': _indexed_fields(names, 'rot_')
+    }
+
+    columns = {key: _field_block(vertices, fields) for key, fields in groups.items() if fields}
+    if 'opacity' in columns:
+        columns['opacity'] = columns['opacity'][:, 0]
+    return columns
+
+
+def cull_mask(vertices, cell_index: CellIndex, pos, axes=GROUND_AXES):
+    """
+    Computes which Gaussians of a cell fall inside its region: those the cell index locates in the cell itself.
+
+    :param vertices: Structured array of vertex records.
+    :param cell_index: CellIndex
+        The index of all cells.
+    :param pos: tuple
+        The (row, col) key of the cell.
+    :param axes: The two position axes compared against the cell boundaries (0 = X, 1 = Y, 2 = Z).
+    :return: numpy.ndarray
+        A boolean mask selecting the Gaussians to keep.
+    """
+    position = splat_columns(vertices)['position']
+    located = cell_index.locate(position[:, axes[0]], position[:, axes[1]])
+    return located == cell_index.positions[(pos[0], pos[1])]
+
+
+def _load_cell_file(file_path: str, pos, cell_index, axes, mmap: bool):
+    """
+    Loads (and culls, when the cell index is given) the splats of one cell in a loader worker.
+
+    :param file_path: Path to the cell's .ply file.
+    :param pos: The (row, col) key of the cell.
+    :param cell_index: The CellIndex of all cells, or None to keep every Gaussian.
+    :param axes: The two position axes compared against the cell boundaries.
+    :param mmap: If True, the vertex data is memory-mapped instead of being read into memory.
+    :return: numpy.ndarray
+    """
+    vertices = SplatLoader.read_ply(file_path, mmap)
+    if cell_index is not None:
+        vertices = vertices[cull_mask(vertices, cell_index, pos, axes)]
+
+    return vertices
+
+
+def splats_to_dicts(vertices):
+    """
+    Builds the per-Gaussian dictionary view of a structured array of splats.
+
+    :param vertices: Structured array of vertex records as returned by SplatLoader.read_ply.
+    :return: list
+        A list of dictionaries with the 'position', 'normal', 'features_dc', 'features_rest', 'opacity', 'scale' and
+        'rotation' of each Gaussian.
+    """
+    columns = splat_columns(vertices)
+    keys = [key for key in columns if key != 'opacity']
+    opacities = columns['opacity'].tolist() if 'opacity' in columns else [0.0] * len(vertices)
+    rows = {key: columns[key].tolist() for key in keys}
+
+    return [
+        dict({key: tuple(rows[key][i]) for key in keys}, opacity=opacities[i])
+        for i in range(len(vertices))
+    ]
+
+
+def dicts_to_splats(splat_list):
+    """
+    Converts a list of per-Gaussian dictionaries into a structured array of splats (the inverse of splats_to_dicts).
+
+    The property layout follows the number of values of each attribute in the first Gaussian, so the SH degree of the
+    model is preserved.
+
+    :param splat_list: list
+        A list of dictionaries with the 'position', 'normal', 'features_dc', 'features_rest', 'opacity', 'scale' and
+        'rotation' of each Gaussian.
+    :return: numpy.ndarray
+        A structured array of vertex records.
+    """
+    if not splat_list:
+        return np.empty(0, dtype=PlySchema.gaussian().dtype)
+
+    first = splat_list[0]
+    names = []
+    groups = [('position', ['x', 'y', 'z']), ('normal', ['nx', 'ny', 'nz']), ('features_dc', 'f_dc_'),
+              ('features_rest', 'f_rest_'), ('opacity', ['opacity']), ('scale', 'scale_'), ('rotation', 'rot_')]
+    keys = []
+    for key, fields in groups:
+        if key not in first:
+            continue
+        count = 1 if key == 'opacity' else len(first[key])
+        names += fields[:count] if isinstance(fields, list) else [f'{fields}{i}' for i in range(count)]
+        keys.append(key)
+
+    values = np.array([
+        [value for key in keys for value in ((splat[key],) if key == 'opacity' else splat[key])]
+        for splat in splat_list
+    ], dtype=np.float32)
+
+    schema = PlySchema([(name, 'float') for name in names])
+    vertices = np.empty(len(splat_list), dtype=schema.dtype)
+    vertices.view(np.float32).reshape(len(splat_list), len(names))[:] = values
+    return vertices
@@ -1,15 +1,52 @@
+import json
+import os
+
+import numpy as np
+
+from src.common.cell_index import CellIndex
+from src.common.cell_manifest import GROUND_AXES
+from src.common.colmap_loader import file_fingerprint
+from src.common.instrumentation import stage, progress
+from src.merge.splat_loader import SplatLoader, cull_mask, dicts_to_splats
+from src.merge.splat_exporter import SplatExporter
+
+
+# Version of the layout of the culled cell cache; bump it to invalidate existing caches
+MERGE_CACHE_VERSION = 1
+
+
 class SplatMerger:
-    def __init__(self, splats, cells):
+    def __init__(self, splats, cells, axes=GROUND_AXES):
         """
         Initializes the SplatMerger with the splats and cells dictionaries
 
         :param splats: dict
-            A dictionary containing the GS results of the split scenes
+            A dictionary containing the GS results of the split scenes, either as structured arrays
+            (see SplatLoader.load_splats_columnar) or as lists of splats. merge_splats_streaming also accepts the
+            paths of the .ply files (see SplatLoader.list_splat_files)
         :param cells: dict
             A dictionary containing the cell boundaries of the split scenes
+        :param axes: tuple
+            The two position axes compared against the cell boundaries (0 = X, 1 = Y, 2 = Z). Defaults to the X/Z
+            ground plane the splitter bins points on; see CellManifest.axes for the axes recorded with the cells
         """
         self.splats = splats
         self.cells = cells
+        self.axes = axes
+        self.cell_index = CellIndex.from_cells(cells)
+
+    def cull_mask(self, vertices, pos):
+        """
+        Computes which Gaussians of a cell fall inside its bounding box region
+
+        :param vertices: numpy.ndarray
+            A structured array of the cell's splats
+        :param pos: tuple
+            The (row, col) key of the cell
+        :return: numpy.ndarray
+            A boolean mask selecting the Gaussians to keep
+        """
+        return cull_mask(vertices, self.cell_index, pos, self.axes)
 
     def cull_gaussians(self):
         """
@@ -17,49 +54,217 @@ class SplatMerger:
 
         :return: dict
             A dictionary containing the GS results of the split scenes after boundary-based culling,
-            where the keys are the respective row and column computed during splitting and the values are a list of splats
+            where the keys are the respective row and column computed during splitting and the values are structured
+            arrays of splats
         """
         new_splats = {}
+        before = 0
+        with stage('cull'):
+            for done, (pos, splat) in enumerate(self.splats.items(), 1):
+                progress('Culling cells', done, len(self.splats))
+                cell = self.cells.get((pos[0], pos[1]))
+                if cell is None:
+                    print(f"Warning: Cell boundaries for position {pos} not found.")
+                    continue
+
+                vertices = splat if isinstance(splat, np.ndarray) else dicts_to_splats(splat)
+
+                # Get Gaussians that fall inside the cell bounding box region
+                new_splats[pos] = vertices[self.cull_mask(vertices, pos)]
+                before += len(vertices)
+
+        after = sum(len(splat) for splat in new_splats.values())
+        print(f"Culled {len(new_splats)} cells: {before} splats before culling, {after} splats after culling")
+        return new_splats
+
+    def merge_splats(self, culled: bool = False):
+        """
+        Merges all culled Gaussians into a single array representing the complete scene
+
+        :param culled: bool
+            If True, the splats were already culled (e.g., by SplatLoader.load_splats_parallel with the same cells
+            and axes) and are merged as they are
+        :return: numpy.ndarray
+            A structured array containing all the remaining Gaussians after culling
+        """
+        # First, cull the Gaussians based on cell boundaries
+        culled_splats = self.splats if culled else self.cull_gaussians()
+
+        # Log the number of cells being merged
+        print(f"Merging splats from {len(culled_splats)} cells")
+
+        dtypes = {splat.dtype for splat in culled_splats.values()}
+        if len(dtypes) > 1:
+            raise ValueError("Cannot merge cells whose splats have different PLY properties")
+
+        # Preallocate the complete scene and copy every cell's splats into place
+        total = sum(len(splat) for splat in culled_splats.values())
+        complete_splat = np.empty(total, dtype=dtypes.pop() if dtypes else dicts_to_splats([]).dtype)
+
+        offset = 0
+        with stage('merge'):
+            for done, splat in enumerate(culled_splats.values(), 1):
+                progress('Merging cells', done, len(culled_splats))
+                complete_splat[offset:offset + len(splat)] = splat
+                offset += len(splat)
+
+        return complete_splat
+
+    def _stream_cells(self):
+        """
+        Yields the cells that have boundaries, loading each one only when it is reached
+
+        :return: generator
+            (position, structured array of splats, cell boundaries) tuples
+        """
         for pos, splat in self.splats.items():
             cell = self.cells.get((pos[0], pos[1]))
             if cell is None:
                 print(f"Warning: Cell boundaries for position {pos} not found.")
                 continue
 
-            min_point = cell['min']
-            max_point = cell['max']
+            if isinstance(splat, str):
+                vertices = SplatLoader.read_ply(splat, mmap=True)
+            elif isinstance(splat, np.ndarray):
+                vertices = splat
+            else:
+                vertices = dicts_to_splats(splat)
 
-            # Get Gaussians that fall inside the cell bounding box region
-            remaining_splat_data = [
-                gauss for gauss in splat
-                if min_point[0] <= gauss['position'][0] < max_point[0]
-                and min_point[1] <= gauss['position'][1] < max_point[1]
-            ]
+            yield pos, vertices, cell
 
-            print(f"Cell {pos}: {len(splat)} splats before culling, {len(remaining_splat_data)} splats after culling")
-            new_splats[pos] = remaining_splat_data
+    def merge_splats_streaming(self, output_path: str):
+        """
+        Culls and writes the Gaussians straight to a .ply file, one cell at a time
 
-        return new_splats
+        A first pass counts the surviving Gaussians of every cell so the header can be written up front; the second
+        pass culls each cell again and appends its survivors, so only one culled cell is held in memory at a time.
 
-    def merge_splats(self):
+        :param output_path: str
+            The path of the .ply file to write
+        :return: int
+            The number of Gaussians written
         """
-        Merges all culled Gaussians into a single list representing the complete scene
+        # First pass: count the surviving Gaussians and check that all cells share the same properties
+        total = 0
+        dtype = None
+        with stage('count'):
+            for pos, vertices, cell in self._stream_cells():
+                if dtype is None:
+                    dtype = vertices.dtype
+                elif vertices.dtype != dtype:
+                    raise ValueError("Cannot merge cells whose splats have different PLY properties")
+                total += int(np.count_nonzero(self.cull_mask(vertices, pos)))
+
+        if dtype is None:
+            dtype = dicts_to_splats([]).dtype
+
+        # Second pass: cull every cell again and append its survivors to the output file
+        def culled_cells():
+            for done, (pos, vertices, cell) in enumerate(self._stream_cells(), 1):
+                progress('Merging cells', done, len(self.splats))
+                yield vertices[self.cull_mask(vertices, pos)]
 
-        :return: list
-            A list containing all the remaining Gaussians after culling
+        with stage('merge'):
+            se = SplatExporter(culled_cells(), output_path)
+            return se.export_splat_stream(total, dtype)
+
+    def _cached_cell(self, pos, file_path: str, cache_dir: str):
         """
-        # First, cull the Gaussians based on cell boundaries
-        culled_splats = self.cull_gaussians()
+        Returns the culled splats of a cell from the cache, culling the cell's .ply file again when it changed
 
-        # Initialize an empty list to hold all merged splats
-        complete_splat = []
+        A cell's cache is a .npy file of its culled splats plus a .json file holding the key it was built from: the
+        fingerprint of the .ply file (see file_fingerprint), the cell boundaries and the culling axes. The key is
+        written last, so an interrupted write is never picked up
 
-        # Log the number of cells being merged
-        print(f"Merging splats from {len(culled_splats)} cells")
+        :param pos: tuple
+            The (row, col) key of the cell
+        :param file_path: str
+            The path of the cell's .ply file
+        :param cache_dir: str
+            The directory of the culled cell cache
+        :return: tuple
+            The culled splats (memory-mapped from the cache) and whether they were culled again
+        """
+        cell = self.cells[(pos[0], pos[1])]
+        key = {
+            'version': MERGE_CACHE_VERSION,
+            'file': file_fingerprint(file_path),
+            'min': [float(value) for value in cell['min']],
+            'max': [float(value) for value in cell['max']],
+            'axes': list(self.axes)
+        }
+        segment_path = os.path.join(cache_dir, f"{pos[0]}_{pos[1]}.npy")
+        key_path = os.path.join(cache_dir, f"{pos[0]}_{pos[1]}.json")
 
-        # Efficiently merge all splats from each cell
-        for pos, splat_list in culled_splats.items():
-            print(f"Merging cell {pos} with {len(splat_list)} splats")
-            complete_splat.extend(splat_list)
+        # Reuse the culled splats when they were built from the same file and boundaries
+        try:
+            with open(key_path, 'r') as key_file:
+                if json.load(key_file) == key:
+                    return np.load(segment_path, mmap_mode='r'), False
+        except (OSError, ValueError):
+            pass
 
-        return complete_splat
+        vertices = SplatLoader.read_ply(file_path, mmap=True)
+        remaining_splat_data = vertices[self.cull_mask(vertices, pos)]
+
+        if os.path.exists(key_path):
+            os.remove(key_path)
+        np.save(segment_path, remaining_splat_data)
+        with open(key_path, 'w') as key_file:
+            json.dump(key, key_file)
+
+        return np.load(segment_path, mmap_mode='r'), True
+
+    def merge_splats_incremental(self, output_path: str, cache_dir: str):
+        """
+        Rebuilds the merged .ply file from cached culled cells, culling only the cells whose .ply file changed
+
+        The culled splats of every cell are kept in cache_dir between runs, so after one cell is retrained only that
+        cell is read and culled again; the output is then streamed from the cached segments
+
+        :param output_path: str
+            The path of the .ply file to write
+        :param cache_dir: str
+            The directory of the culled cell cache
+        :return: int
+            The number of Gaussians written
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # First pass: bring the cache of every cell up to date and count the surviving Gaussians
+        segments = []
+        total = 0
+        dtype = None
+        culled = 0
+        with stage('cull'):
+            for pos, file_path in self.splats.items():
+                if not isinstance(file_path, str):
+                    raise ValueError("merge_splats_incremental requires the paths of the .ply files")
+                if (pos[0], pos[1]) not in self.cells:
+                    print(f"Warning: Cell boundaries for position {pos} not found.")
+                    continue
+
+                progress('Culling cells', len(segments) + 1, len(self.splats))
+                segment, changed = self._cached_cell(pos, file_path, cache_dir)
+                if dtype is None:
+                    dtype = segment.dtype
+                elif segment.dtype != dtype:
+                    raise ValueError("Cannot merge cells whose splats have different PLY properties")
+
+                segments.append(pos)
+                total += len(segment)
+                culled += changed
+
+        print(f"Culled {culled} changed cells, reused {len(segments) - culled} cached cells")
+
+        if dtype is None:
+            dtype = dicts_to_splats([]).dtype
+
+        # Second pass: append the cached segments to the output file
+        def cached_cells():
+            for pos in segments:
+                yield np.load(os.path.join(cache_dir, f"{pos[0]}_{pos[1]}.npy"), mmap_mode='r')
+
+        with stage('merge'):
+            se = SplatExporter(cached_cells(), output_path)
+            return se.export_splat_stream(total, dtype)
@@ -1,27 +1,36 @@
 import numpy as np
 
+from src.common.scene import is_columnar
+from src.common.subsampling import preview_xyz
+
 
 class GroundPlaneProjector:
     def __init__(self, scene):
         """
         Initializes the Ground Plane Projector with the loaded COLMAP scene
 
-        :param scene: dict
+        :param scene: dict or Scene
             A dictionary containing:
             - "points": A dictionary of 3D points where each key is a point ID and value is a dictionary with point attributes
              (e.g., "xyz" for coordinates).
             - "cameras": A dictionary of camera and image information where each key is an image ID and value is a dictionary with camera parameters
              (e.g., "tvec" for translation vectors).
+            Columnar scene dictionaries and Scene objects (see COLMAPLoader.load_scene_columnar) are used as is.
         """
         self.scene = scene
 
-    def project_to_2d(self):
+    def project_to_2d(self, max_points: int = None, strategy: str = 'voxel'):
         """
         Projects the COLMAP scene from 3D to 2D using a ground plane projection for visualization purposes.
 
         This method assumes that the z-coordinate is used as depth and ignores it in the 2D projection. The resulting projection
         maps the x and y coordinates of points and camera positions onto a 2D plane.
 
+        :param max_points: int
+            Optional point budget of a preview projection: larger scenes are subsampled
+            (see subsampling.subsample_points). By default every point is projected.
+        :param strategy: str
+            The subsampling strategy: 'voxel', 'cell' or 'error'.
         :return: dict
             A dictionary containing:
             - "points": A numpy array of projected 3D points on the ground plane (x and z coordinates).
@@ -32,8 +41,11 @@ class GroundPlaneProjector:
         cameras = self.scene['cameras']
 
         # Convert points and cameras to numpy arrays if they are not already
-        points_xyz = np.array([point['xyz'] for point in points.values()])
-        cameras_tvec = np.array([camera['tvec'] for camera in cameras.values()])
+        points_xyz = preview_xyz(points, max_points, strategy)
+        if is_columnar(cameras):
+            cameras_tvec = cameras['tvec']
+        else:
+            cameras_tvec = np.array([camera['tvec'] for camera in cameras.values()])
 
         # Project 3D points to 2D (ignoring the y-coordinate)
         projected_points = points_xyz[:, [0, 2]]
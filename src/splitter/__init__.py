@@ -1,3 +1,5 @@
 # src/splitter/__init__.py
 from .scene_splitter import SceneSplitter
 from .scene_exporter import SceneExporter
+from .export_pipeline import ExportPipeline
+from .cell_shards import CellShards
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from src.common.instrumentation import count_bytes
+from src.common.scene import take_points
+
+# On-disk dtype and width of every column of a point shard
+SHARD_COLUMNS = {
+    "ids": ('<u8', 1),
+    "xyz": ('<f8', 3),
+    "rgb": ('u1', 3),
+    "error": ('<f8', 1),
+    "track_lengths": ('<i8', 1),
+    "track_image_ids": ('<u4', 1),
+    "track_point2d_idxs": ('<u4', 1)
+}
+
+
+class CellShards:
+    def __init__(self, spill_dir: str):
+        """
+        Initializes the CellShards, per-cell columnar point files on disk that batches of binned points are appended
+        to, so a split never holds more than one batch of points plus one cell.
+
+        Every cell gets a directory named after its position ("row_col") holding one raw file per column (see
+        SHARD_COLUMNS); track offsets are stored as track lengths, so appending never rewrites earlier rows.
+
+        :param spill_dir: str
+            Directory the shards are spilled to. The shards go to a new private subdirectory of it, and only what
+            CellShards created is ever deleted, so any existing content of spill_dir is left alone.
+        """
+        self.spill_dir = spill_dir
+        self._created_spill_dir = not os.path.exists(spill_dir)
+        os.makedirs(spill_dir, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix='shards_', dir=spill_dir)
+
+    def cell_dir(self, grid_pos):
+        """
+        :param grid_pos: tuple
+            The (row, col) position of the cell.
+        :return: str
+            The directory of the cell's shard files.
+        """
+        return os.path.join(self.directory, f"{grid_pos[0]}_{grid_pos[1]}")
+
+    def append(self, grid_pos, points):
+        """
+        Appends columnar points to the shards of a cell.
+
+        :param grid_pos: tuple
+            The (row, col) position of the cell.
+        :param points: dict
+            The points, laid out like COLMAPLoader.load_points3D_columnar's.
+        """
+        cell_dir = self.cell_dir(grid_pos)
+        os.makedirs(cell_dir, exist_ok=True)
+
+        columns = dict(points, track_lengths=np.diff(points['track_offsets']))
+        for name, (dtype, _) in SHARD_COLUMNS.items():
+            data = np.ascontiguousarray(columns[name], dtype=dtype)
+            with open(os.path.join(cell_dir, name + '.bin'), 'ab') as shard_file:
+                shard_file.write(data.tobytes())
+            count_bytes(written=data.nbytes)
+
+    def append_batch(self, batch, member_points, member_cells, cell_keys):
+        """
+        Appends the binned points of a batch to the shards of their cells, in batch order within every cell.
+
+        :param batch: dict
+            The columnar points of the batch.
+        :param member_points: numpy.ndarray
+            Rows of the batch of every (point, cell) membership (see SceneSplitter.cell_memberships).
+        :param member_cells: numpy.ndarray
+            Cell indices of every membership.
+        :param cell_keys: list
+            The (row, col) positions of the cells, by cell index.
+        """
+        order = np.argsort(member_cells, kind='stable')
+        sorted_cells = member_cells[order]
+        cells, starts = np.unique(sorted_cells, return_index=True)
+        ends = np.append(starts[1:], len(sorted_cells))
+
+        for cell_idx, start, end in zip(cells.tolist(), starts.tolist(), ends.tolist()):
+            self.append(cell_keys[cell_idx], take_points(batch, member_points[order[start:end]]))
+
+    def read(self, grid_pos):
+        """
+        Reads back the points of a cell.
+
+        :param grid_pos: tuple
+            The (row, col) position of the cell.
+        :return: dict
+            The cell's points, laid out like COLMAPLoader.load_points3D_columnar's (empty if nothing was appended).
+        """
+        cell_dir = self.cell_dir(grid_pos)
+
+        columns = {}
+        for name, (dtype, width) in SHARD_COLUMNS.items():
+            path = os.path.join(cell_dir, name + '.bin')
+            data = np.fromfile(path, dtype=dtype) if os.path.exists(path) else np.empty(0, dtype=dtype)
+            count_bytes(read=data.nbytes)
+            columns[name] = data.reshape(-1, width) if width > 1 else data
+
+        track_offsets = np.zeros(len(columns['ids']) + 1, dtype=np.int64)
+        np.cumsum(columns.pop('track_lengths'), out=track_offsets[1:])
+        columns['track_offsets'] = track_offsets
+        return columns
+
+    def remove(self, grid_pos):
+        """
+        Deletes the shards of a cell.
+
+        :param grid_pos: tuple
+            The (row, col) position of the cell.
+        """
+        shutil.rmtree(self.cell_dir(grid_pos), ignore_errors=True)
+
+    def cleanup(self):
+        """
+        Deletes every shard and the shards directory, and the spill directory as well when CellShards created it and
+        it is now empty.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        if self._created_spill_dir:
+            try:
+                os.rmdir(self.spill_dir)
+            except OSError:
+                pass
@@ -0,0 +1,351 @@
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from src.common.cell_manifest import CellManifest, MANIFEST_NAME, membership_hash
+from src.common.instrumentation import stage, progress
+from src.common.scene import Scene, SceneView, take_images
+from src.common.visualization import SceneVisualizer
+from src.projection.ground_plane_projection import GroundPlaneProjector
+from src.splitter.scene_exporter import SceneExporter
+
+
+def export_cell(grid_pos, cell_scene, output_dir: str, plot_prefix: str):
+    """
+    Exports a single cell: writes its COLMAP files, projects it to 2D and plots the projection.
+
+    Defined at module level so it can be sent to worker processes.
+
+    :param grid_pos: tuple
+        The (row, col) position of the cell.
+    :param cell_scene: dict
+        The cell scene as produced by SceneSplitter.split_scene.
+    :param output_dir: str
+        Directory under which the cell's COLMAP files are written.
+    :param plot_prefix: str
+        Prefix of the 2D plot filename.
+    :return: tuple
+        The (row, col) position of the exported cell and the content hashes of its COLMAP files.
+    """
+    str_row = str(grid_pos[0])
+    str_col = str(grid_pos[1])
+
+    # Export the cell scene in COLMAP format
+    cell_dir = os.path.join(output_dir, str_row + '_' + str_col, 'colmap', 'sparse', '0')
+    se = SceneExporter(cell_scene, cell_dir)
+    se.export_scene()
+
+    # Project the cell scene in 2D
+    gpp = GroundPlaneProjector(cell_scene)
+    projected_scene = gpp.project_to_2d()
+
+    # Visualize the cell scene in 2D
+    sv = SceneVisualizer(projected_scene)
+    sv.plot_scene2D(plot_prefix + str_row + '_' + str_col + '.png')
+
+    return grid_pos, se.file_hashes
+
+
+# Parent scene of the SceneView cells, set once in every worker process
+_worker_parent_scene = None
+
+
+def _init_worker(parent_scene):
+    """
+    Stores the parent scene of the SceneView cells in a worker process.
+
+    :param parent_scene: Scene
+        The scene the cells' row positions refer to.
+    """
+    global _worker_parent_scene
+    _worker_parent_scene = parent_scene
+
+
+def _export_cell_view(grid_pos, point_rows, image_rows, output_dir: str, plot_prefix: str):
+    """
+    Exports a SceneView cell in a worker process, rebuilding the view from its row positions and the shared parent.
+    """
+    cell_scene = SceneView(_worker_parent_scene, point_rows, image_rows)
+    return export_cell(grid_pos, cell_scene, output_dir, plot_prefix)
+
+
+class ExportPipeline:
+    def __init__(self, output_dir: str, plot_prefix: str, workers: int = None, incremental: bool = False):
+        """
+        Initializes the ExportPipeline that exports, projects and plots split cells.
+
+        :param output_dir: str
+            Directory where the cell manifest and the cell directories are written.
+        :param plot_prefix: str
+            Prefix of the per-cell 2D plot filenames.
+        :param workers: int
+            Number of worker processes. Defaults to the number of CPUs; 1 exports the cells in the current process.
+        :param incremental: bool
+            If True, cells whose boundaries and point and camera membership are unchanged since the manifest already
+            in output_dir was written are not exported again, even when other split parameters changed. Every cell is
+            exported when that manifest was split from other source files (see CellManifest.matches).
+        """
+        self.output_dir = output_dir
+        self.plot_prefix = plot_prefix
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.incremental = incremental
+
+    def previous_manifest(self):
+        """
+        :return: CellManifest
+            The manifest already in output_dir, or None when there is none.
+        """
+        manifest_path = os.path.join(self.output_dir, MANIFEST_NAME)
+        return CellManifest.load(manifest_path) if os.path.exists(manifest_path) else None
+
+    @staticmethod
+    def previous_cells(previous, sources=None):
+        """
+        Selects the cells of the previous manifest an incremental export may reuse.
+
+        :param previous: CellManifest
+            The manifest already in output_dir (see previous_manifest), or None.
+        :param sources: dict
+            The fingerprints of the current source files (see COLMAPLoader.source_fingerprints).
+        :return: dict
+            The previous manifest's cells, keyed by position. Empty, so every cell is exported, when there is no
+            previous manifest or when it was split from other source files.
+        """
+        if previous is None:
+            return {}
+        if not previous.matches(sources):
+            print("Incremental export: the source files changed, exporting every cell")
+            return {}
+        return previous.cells
+
+    def unchanged_cells(self, cells, split_scenes, memberships, previous):
+        """
+        Finds the cells whose exported files are still up to date: cells of the previous manifest with the same
+        boundaries and membership hash, whose exported files are still there. The split parameters may differ.
+
+        :param cells: list
+            The grid of cells returned by SceneSplitter.split_scene.
+        :param split_scenes: list
+            The (position, cell scene) pairs returned by SceneSplitter.split_scene.
+        :param memberships: dict
+            The membership hashes of the cells, keyed by position (see membership_hash).
+        :param previous: dict
+            The cells of the previous manifest (see previous_cells).
+        :return: dict
+            The content hashes of the exported files of every unchanged cell, keyed by position.
+        """
+        unchanged = {}
+        for grid_pos, _ in split_scenes:
+            cell = previous.get((grid_pos[0], grid_pos[1]))
+            if cell is None or not cell.get('files') or cell.get('membership') != memberships[grid_pos]:
+                continue
+
+            # The cell must cover the same area
+            boundaries = cells[grid_pos] if isinstance(cells, dict) else cells[grid_pos[0]][grid_pos[1]]
+            if [float(value) for value in boundaries['min']] != cell['min'] or \
+                    [float(value) for value in boundaries['max']] != cell['max']:
+                continue
+
+            # The files must still be there as well
+            cell_dir = os.path.join(self.output_dir, f"{grid_pos[0]}_{grid_pos[1]}", 'colmap', 'sparse', '0')
+            if all(os.path.exists(os.path.join(cell_dir, file_name)) for file_name in cell['files']):
+                unchanged[grid_pos] = cell['files']
+
+        return unchanged
+
+    def remove_stale_cells(self, previous, manifest):
+        """
+        Deletes the cell directories and plots of the previous manifest's cells that are not part of the new one.
+
+        :param previous: CellManifest
+            The manifest already in output_dir, or None.
+        :param manifest: CellManifest
+            The new manifest.
+        """
+        if previous is None:
+            return
+
+        stale = [pos for pos in previous.cells if pos not in manifest.cells]
+        for row, col in stale:
+            shutil.rmtree(os.path.join(self.output_dir, f"{row}_{col}"), ignore_errors=True)
+            plot_path = self.plot_prefix + f"{row}_{col}.png"
+            if os.path.exists(plot_path):
+                os.remove(plot_path)
+
+        if stale:
+            print(f"Removed {len(stale)} cells that are no longer part of the split")
+
+    def write_manifest(self, cells, split_scenes, grid=None, file_hashes=None, memberships=None, counts=None,
+                       sources=None, previous=None):
+        """
+        Writes the cell manifest ('cells.json'): the grid parameters, the fingerprints of the source files and, per
+        cell, its boundaries, point and camera counts and the content hashes of its exported COLMAP files. The cells
+        of the previous manifest that are not part of the new one are deleted.
+
+        :param cells: list
+            The grid of cells returned by SceneSplitter.split_scene.
+        :param split_scenes: list
+            The (position, cell scene) pairs returned by SceneSplitter.split_scene.
+        :param grid: dict
+            The splitting parameters (see SceneSplitter.grid_parameters).
+        :param file_hashes: dict
+            The content hashes of the exported files of every cell, keyed by position.
+        :param memberships: dict
+            The membership hashes of every cell, keyed by position (see membership_hash).
+        :param counts: dict
+            The point and camera counts of every cell, keyed by position, when the cell scenes are not at hand.
+        :param sources: dict
+            The fingerprints of the source COLMAP files (see COLMAPLoader.source_fingerprints).
+        :param previous: CellManifest
+            The manifest already in output_dir (see previous_manifest), or None.
+        :return: CellManifest
+        """
+        manifest = CellManifest.from_split(cells, split_scenes, grid, file_hashes, memberships, counts, sources)
+        self.remove_stale_cells(previous, manifest)
+        manifest.save(os.path.join(self.output_dir, MANIFEST_NAME))
+        return manifest
+
+    def run(self, cells, split_scenes, grid=None, sources=None):
+        """
+        Exports every split cell, spreading the cells over a process pool, then writes the cell manifest.
+
+        At most two cells per worker are in flight at any time, so the pool does not hold a copy of every cell.
+        SceneView cells are sent as row positions only; their parent scene is handed to each worker once. In
+        incremental mode, unchanged cells are skipped.
+
+        :param cells: list
+            The grid of cells returned by SceneSplitter.split_scene.
+        :param split_scenes: list
+            The (position, cell scene) pairs returned by SceneSplitter.split_scene.
+        :param grid: dict
+            The splitting parameters recorded in the manifest (see SceneSplitter.grid_parameters).
+        :param sources: dict
+            The fingerprints of the source COLMAP files recorded in the manifest (see
+            COLMAPLoader.source_fingerprints).
+        :return: CellManifest
+        """
+        with stage('export_cells'):
+            previous = self.previous_manifest()
+            memberships = {grid_pos: membership_hash(cell_scene) for grid_pos, cell_scene in split_scenes}
+            file_hashes = {}
+            if self.incremental:
+                file_hashes = self.unchanged_cells(cells, split_scenes, memberships,
+                                                   self.previous_cells(previous, sources))
+            changed_scenes = [(grid_pos, cell_scene) for grid_pos, cell_scene in split_scenes
+                              if grid_pos not in file_hashes]
+            if self.incremental:
+                print(f"Incremental export: {len(changed_scenes)} changed cells, {len(file_hashes)} unchanged cells")
+
+            if self.workers <= 1:
+                for grid_pos, cell_scene in changed_scenes:
+                    _, file_hashes[grid_pos] = export_cell(grid_pos, cell_scene, self.output_dir, self.plot_prefix)
+                    progress('Exporting cells', len(file_hashes), len(split_scenes))
+                return self.write_manifest(cells, split_scenes, grid, file_hashes, memberships, sources=sources,
+                                           previous=previous)
+
+            # Share the parent scene of view cells with the workers up front
+            parents = {id(cell_scene.parent): cell_scene.parent for _, cell_scene in changed_scenes
+                       if isinstance(cell_scene, SceneView)}
+            parent_scene = next(iter(parents.values())) if len(parents) == 1 else None
+
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(parent_scene,)) as executor:
+                pending = set()
+                for grid_pos, cell_scene in changed_scenes:
+                    if len(pending) >= 2 * self.workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        file_hashes.update(future.result() for future in done)
+                        progress('Exporting cells', len(file_hashes), len(split_scenes))
+
+                    if parent_scene is not None and isinstance(cell_scene, SceneView):
+                        future = executor.submit(_export_cell_view, grid_pos, cell_scene.point_rows,
+                                                 cell_scene.image_rows, self.output_dir, self.plot_prefix)
+                    else:
+                        future = executor.submit(export_cell, grid_pos, cell_scene, self.output_dir, self.plot_prefix)
+                    pending.add(future)
+
+                file_hashes.update(future.result() for future in pending)
+
+        print(f"Exported {len(changed_scenes)} cells to {self.output_dir}")
+        return self.write_manifest(cells, split_scenes, grid, file_hashes, memberships, sources=sources,
+                                   previous=previous)
+
+    def run_spilled(self, cells, split_cells, shards, cameras, intrinsics=None, grid=None, sources=None):
+        """
+        Exports the cells of a spilled split (see SceneSplitter.split_stream), building every cell's scene from its
+        point shards and the cameras, then writes the cell manifest.
+
+        Cells are built one at a time, and at most one cell per worker is in flight, so memory stays bounded by a few
+        cells. Every cell's shards are deleted once it is exported. In incremental mode, unchanged cells are skipped.
+
+        :param cells: list
+            The grid of cells returned by SceneSplitter.split_stream.
+        :param split_cells: list
+            The ((row, col), point rows, camera rows) triples returned by SceneSplitter.split_stream.
+        :param shards: CellShards
+            The shards the split spilled the cells' points to.
+        :param cameras: dict
+            The columnar images of the scene (see COLMAPLoader.load_images_columnar); memory-mapped when cached.
+        :param intrinsics: dict
+            The columnar camera intrinsics of the scene. When given, every cell is exported with the intrinsics of
+            its own cameras, like the cells of an in-memory split (see Scene.intrinsics_for).
+        :param grid: dict
+            The splitting parameters recorded in the manifest (see SceneSplitter.grid_parameters).
+        :param sources: dict
+            The fingerprints of the source COLMAP files recorded in the manifest (see
+            COLMAPLoader.source_fingerprints).
+        :return: CellManifest
+        """
+        file_hashes, memberships, counts = {}, {}, {}
+        num_exported = 0
+        previous = self.previous_manifest()
+        reusable = self.previous_cells(previous, sources) if self.incremental else {}
+
+        # A scene of the cameras only, to select every cell's intrinsics the way Scene.take does
+        camera_scene = Scene(None, cameras, intrinsics)
+
+        with stage('export_cells'):
+            executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+            pending = set()
+            try:
+                for grid_pos, _, camera_rows in split_cells:
+                    # Finalize the cell scene from its shards
+                    cell_images = take_images(cameras, camera_rows)
+                    cell_scene = {
+                        'points': shards.read(grid_pos),
+                        'cameras': cell_images,
+                        'intrinsics': camera_scene.intrinsics_for(cell_images['camera_id'])
+                    }
+                    shards.remove(grid_pos)
+                    memberships[grid_pos] = membership_hash(cell_scene)
+                    counts[grid_pos] = (len(cell_scene['points']['ids']), len(camera_rows))
+
+                    if self.incremental:
+                        unchanged = self.unchanged_cells(cells, [(grid_pos, cell_scene)], memberships, reusable)
+                        if unchanged:
+                            file_hashes.update(unchanged)
+                            continue
+
+                    num_exported += 1
+                    if executor is None:
+                        _, file_hashes[grid_pos] = export_cell(grid_pos, cell_scene, self.output_dir,
+                                                               self.plot_prefix)
+                    else:
+                        if len(pending) >= self.workers:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            file_hashes.update(future.result() for future in done)
+                        pending.add(executor.submit(export_cell, grid_pos, cell_scene, self.output_dir,
+                                                    self.plot_prefix))
+                    progress('Exporting cells', len(counts), len(split_cells))
+
+                file_hashes.update(future.result() for future in pending)
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+
+        if self.incremental:
+            num_unchanged = len(split_cells) - num_exported
+            print(f"Incremental export: {num_exported} changed cells, {num_unchanged} unchanged cells")
+        print(f"Exported {num_exported} cells to {self.output_dir}")
+        split_positions = [(grid_pos, None) for grid_pos, _, _ in split_cells]
+        return self.write_manifest(cells, split_positions, grid, file_hashes, memberships, counts, sources, previous)
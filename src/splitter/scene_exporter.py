@@ -1,19 +1,29 @@
+import hashlib
 import struct
 import os
 
+import numpy as np
+
+from src.common.colmap_loader import POINT3D_RECORD_DTYPE, IMAGE_RECORD_DTYPE, CAMERA_MODEL_NUM_PARAMS
+from src.common.instrumentation import stage, count_bytes
+from src.common.scene import is_columnar, points3D_to_columnar, images_to_columnar
+
 
 class SceneExporter:
     def __init__(self, scene, output_dir: str):
         """
         Initializes the SceneExporter class with the scene and output path.
 
-        :param scene: dict
-            A dictionary containing scene data including cameras and points.
+        :param scene: dict or Scene
+            A dictionary containing scene data including cameras and points, either keyed by id or in columnar form,
+            or a Scene or SceneView (see COLMAPLoader.load_scene_columnar). Camera intrinsics, when known, are
+            exported too.
         :param output_dir: str
             A string containing the directory to save the exported binary files.
         """
         self.scene = scene
         self.output_dir = output_dir
+        self.file_hashes = {}
 
         # Ensure the output directory exists
         os.makedirs(self.output_dir, exist_ok=True)
@@ -21,83 +31,139 @@ class SceneExporter:
     def pack_cameras(self):
         """
         Packs and writes the camera data into a COLMAP-compatible 'images.bin' file.
-        """
-        # Open the output file in binary write mode
-        with open(os.path.join(self.output_dir, 'images.bin'), 'wb') as f:
-            cameras = self.scene['cameras']
-
-            # Write the number of cameras (images)
-            f.write(struct.pack('<Q', len(cameras)))
-
-            for image_id, camera in cameras.items():
-                # Write image_id (4 bytes)
-                f.write(struct.pack('<I', image_id))
-
-                # Write quaternion (qvec) (4 * 8 bytes)
-                f.write(struct.pack('<dddd', *camera['qvec']))
-
-                # Write translation vector (tvec) (3 * 8 bytes)
-                f.write(struct.pack('<ddd', *camera['tvec']))
-
-                # Write camera_id (4 bytes)
-                f.write(struct.pack('<I', camera['camera_id']))
-
-                # Write image name (null-terminated string)
-                f.write(camera['name'].encode('utf-8') + b'\x00')
-
-                # Write the number of 2D points (8 bytes)
-                num_points2d = len(camera['xys'])
-                f.write(struct.pack('<Q', num_points2d))
 
-                # Write 2D points (x, y) coordinates (2 * 8 bytes each)
-                for xy in camera['xys']:
-                    f.write(struct.pack('<dd', *xy))
-
-                # Write 3D point ids associated with each 2D point (8 bytes each)
-                for point3d_id in camera['point3d_ids']:
-                    f.write(struct.pack('<q', point3d_id))
+        Every image record is assembled in memory first, so the file is written with a single call.
+        """
+        cameras = self.scene['cameras']
+        if not is_columnar(cameras):
+            cameras = images_to_columnar(cameras)
+
+        num_images = len(cameras['ids'])
+        offsets = cameras['point2d_offsets'].tolist()
+        names = cameras['name']
+        xys = np.ascontiguousarray(cameras['xys'], dtype='<f8')
+        point3d_ids = np.ascontiguousarray(cameras['point3d_ids'], dtype='<i8')
+
+        # Fixed-size headers: image_id (4 bytes), qvec (4 * 8 bytes), tvec (3 * 8 bytes), camera_id (4 bytes)
+        headers = np.empty(num_images, dtype=IMAGE_RECORD_DTYPE)
+        headers['id'] = cameras['ids']
+        headers['qvec'] = cameras['qvec']
+        headers['tvec'] = cameras['tvec']
+        headers['camera_id'] = cameras['camera_id']
+
+        # Write the number of cameras (images)
+        pieces = [struct.pack('<Q', num_images)]
+        for i in range(num_images):
+            start, end = offsets[i], offsets[i + 1]
+            pieces.append(headers[i:i + 1].tobytes())
+
+            # Image name (null-terminated string)
+            pieces.append(names[i].encode('utf-8') + b'\x00')
+
+            # Number of 2D points (8 bytes), their coordinates (2 * 8 bytes each) and 3D point ids (8 bytes each)
+            pieces.append(struct.pack('<Q', end - start))
+            pieces.append(xys[start:end].tobytes())
+            pieces.append(point3d_ids[start:end].tobytes())
+
+        self._write_file('images.bin', b''.join(pieces))
 
     def pack_points(self):
         """
         Packs and writes the 3D point data into a COLMAP-compatible 'points3D.bin' file.
-        """
-        # Open the output file in binary write mode
-        with open(os.path.join(self.output_dir, 'points3D.bin'), 'wb') as f:
-            points = self.scene['points']
 
-            # Write the number of 3D points
-            f.write(struct.pack('<Q', len(points)))
+        The fixed-size parts of the records and the track elements are scattered into one preassembled buffer, so the
+        file is written with a single call.
+        """
+        points = self.scene['points']
+        if not is_columnar(points):
+            points = points3D_to_columnar(points)
+
+        num_points = len(points['ids'])
+        track_offsets = points['track_offsets']
+        track_lengths = np.diff(track_offsets)
+
+        # Fixed-size parts: point3d_id (8 bytes), xyz (3 * 8 bytes), rgb (3 bytes), error (8 bytes),
+        # track length (8 bytes)
+        records = np.empty(num_points, dtype=POINT3D_RECORD_DTYPE)
+        records['id'] = points['ids']
+        records['xyz'] = points['xyz']
+        records['rgb'] = points['rgb']
+        records['error'] = points['error']
+        records['track_length'] = track_lengths
+
+        # Track elements: image_id (4 bytes) and point2d_idx (4 bytes) for each observation
+        tracks = np.empty((len(points['track_image_ids']), 2), dtype='<u4')
+        tracks[:, 0] = points['track_image_ids']
+        tracks[:, 1] = points['track_point2d_idxs']
+
+        # Lay out the records after the number of points and mark the bytes of their fixed-size parts
+        record_size = POINT3D_RECORD_DTYPE.itemsize
+        starts = 8 + record_size * np.arange(num_points, dtype=np.int64) + 8 * track_offsets[:-1]
+        body = np.empty(8 + record_size * num_points + 8 * len(tracks), dtype=np.uint8)
+        marks = np.zeros(len(body) + 1, dtype=np.int8)
+        marks[starts] = 1
+        marks[starts + record_size] -= 1
+        fixed_mask = np.cumsum(marks[:-1], dtype=np.int8).view(np.bool_)
+        track_mask = ~fixed_mask
+        track_mask[:8] = False
+
+        # Write the number of 3D points, then scatter the records and tracks
+        body[:8] = np.frombuffer(struct.pack('<Q', num_points), dtype=np.uint8)
+        body[fixed_mask] = records.view(np.uint8)
+        body[track_mask] = tracks.reshape(-1).view(np.uint8)
+
+        self._write_file('points3D.bin', body.data)
+
+    def pack_intrinsics(self, intrinsics):
+        """
+        Packs and writes the camera intrinsics into a COLMAP-compatible 'cameras.bin' file.
 
-            for point3d_id, point in points.items():
-                # Write point3d_id (8 bytes)
-                f.write(struct.pack('<Q', point3d_id))
+        :param intrinsics: dict
+            A dictionary of camera intrinsics arrays (see COLMAPLoader.load_cameras_columnar).
+        """
+        pieces = [struct.pack('<Q', len(intrinsics['ids']))]
+        for i, camera_id in enumerate(intrinsics['ids'].tolist()):
+            model_id = int(intrinsics['model_id'][i])
+            num_params = CAMERA_MODEL_NUM_PARAMS[model_id]
 
-                # Write the 3D coordinates (x, y, z) (3 * 8 bytes)
-                f.write(struct.pack('<ddd', *point['xyz']))
+            # Write camera_id and model_id (4 bytes each), width and height (8 bytes each) and the parameters
+            pieces.append(struct.pack('<iiQQ', camera_id, model_id,
+                                      int(intrinsics['width'][i]), int(intrinsics['height'][i])))
+            pieces.append(np.ascontiguousarray(intrinsics['params'][i, :num_params], dtype='<f8').tobytes())
 
-                # Write the RGB color values (3 bytes)
-                f.write(struct.pack('<BBB', *point['rgb']))
+        self._write_file('cameras.bin', b''.join(pieces))
 
-                # Write the reprojection error (8 bytes)
-                f.write(struct.pack('<d', point['error']))
+    def _write_file(self, file_name: str, data):
+        """
+        Writes a packed file and records the SHA-1 hash of its content in self.file_hashes.
 
-                # Write the number of observations (track length) (8 bytes)
-                track_length = len(point['track'])
-                f.write(struct.pack('<Q', track_length))
+        :param file_name: str
+            Name of the file inside the output directory.
+        :param data: bytes-like
+            The complete file content.
+        """
+        # Open the output file in binary write mode
+        with open(os.path.join(self.output_dir, file_name), 'wb') as f:
+            f.write(data)
 
-                # Write the track elements (image_id and point2d_idx for each observation)
-                for image_id, point2d_idx in point['track']:
-                    f.write(struct.pack('<I', image_id))       # image_id (4 bytes)
-                    f.write(struct.pack('<I', point2d_idx))   # point2d_idx (4 bytes)
+        self.file_hashes[file_name] = hashlib.sha1(data).hexdigest()
+        count_bytes(written=len(data))
 
     def export_scene(self):
         """
-        Exports the entire scene into binary files ('images.bin' and 'points3D.bin').
+        Exports the entire scene into binary files ('images.bin', 'points3D.bin' and, when the camera intrinsics are
+        known, 'cameras.bin').
         """
-        # Pack and export points3D.bin
-        self.pack_points()
+        with stage('export'):
+            # Pack and export points3D.bin
+            self.pack_points()
+
+            # Pack and export images.bin
+            self.pack_cameras()
 
-        # Pack and export images.bin
-        self.pack_cameras()
+            # Pack and export cameras.bin
+            intrinsics = self.scene.get('intrinsics') if isinstance(self.scene, dict) else self.scene['intrinsics']
+            if intrinsics is not None:
+                self.pack_intrinsics(intrinsics)
 
         print(f"Scene successfully exported to {self.output_dir}")
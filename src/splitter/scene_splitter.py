@@ -1,55 +1,142 @@
 import numpy as np
-from collections import defaultdict
+
+from src.common.cell_index import CellIndex
+from src.common.cell_manifest import GROUND_AXES
+from src.common.instrumentation import stage, progress
+from src.common.scene import Scene, is_columnar, take_points, take_images, points3D_to_columnar, take_ragged
 
 
 class SceneSplitter:
-    def __init__(self, scene, rows: int, cols: int, num_of_points: int):
+    def __init__(self, scene, rows: int, cols: int, num_of_points: int, max_points: int = None,
+                 max_cameras: int = None, max_depth: int = 4, margin: float = 0.0, camera_visibility: float = 0.003):
         """
         Initializes the SceneSplitter with the scene data and grid dimensions.
 
-        :param scene: dict
-            A dictionary containing scene data including cameras and points.
+        :param scene: dict or Scene
+            A dictionary containing scene data including cameras and points, either keyed by id or in columnar form,
+            or a Scene (see COLMAPLoader.load_scene_columnar). Cells are returned in the same representation, except
+            that the cells of a Scene are SceneViews into it.
         :param rows: int
             Number of rows to divide the scene into.
         :param cols: int
             Number of columns to divide the scene into.
         :param num_of_points: int
             Number of points in the scene
+        :param max_points: int
+            Point budget of a cell. Setting it (or max_cameras) enables adaptive splitting: every cell of the
+            rows x cols grid is recursively divided into quadrants until each cell fits the budgets.
+        :param max_cameras: int
+            Camera budget of a cell in adaptive splitting, counted as the distinct images observing its points.
+        :param max_depth: int
+            Maximum number of quadrant subdivisions of a grid cell in adaptive splitting.
+        :param margin: float
+            Width of the buffer zone around every cell, in scene units. Points closer than this to a cell (on both X
+            and Z) are exported with it as well, so Gaussians near its edges stay constrained; the cell boundaries
+            themselves, used for culling when merging, are not widened.
+        :param camera_visibility: float
+            Minimum visibility score of a camera in a cell: the number of observations of the cell's points (buffer
+            included) by the camera, divided by the number of those points. Cameras scoring lower are pruned.
         """
         self.scene = scene
         self.rows = rows
         self.cols = cols
         self.num_of_points = num_of_points
+        self.max_points = max_points
+        self.max_cameras = max_cameras
+        self.max_depth = max_depth
+        self.margin = margin
+        self.camera_visibility = camera_visibility
         self.cells = [[None for _ in range(self.cols)] for _ in range(self.rows)]
+        self.x_edges = None
+        self.z_edges = None
+        self.cell_keys = None
+        self.cell_lookup = None
+        self.cell_index = None
+        self._point_arrays = None
 
-    def create_cells(self):
+    @property
+    def adaptive(self):
         """
-        Creates a grid of cells based on the bounding box of 3D point positions.
+        :return: bool
+            Whether cells are subdivided adaptively to fit the point and camera budgets.
+        """
+        return self.max_points is not None or self.max_cameras is not None
+
+    def grid_parameters(self):
+        """
+        :return: dict
+            The splitting parameters and the bounding box of the finest grid, as recorded in the cell manifest.
+            Available once the cells are created.
         """
+        return {
+            "rows": self.rows,
+            "cols": self.cols,
+            "max_points": self.max_points,
+            "max_cameras": self.max_cameras,
+            "max_depth": self.max_depth if self.adaptive else 0,
+            "margin": float(self.margin),
+            "camera_visibility": float(self.camera_visibility),
+            "axes": list(GROUND_AXES),
+            "min": [float(self.x_edges[0]), float(self.z_edges[-1])],
+            "max": [float(self.x_edges[-1]), float(self.z_edges[0])]
+        }
 
-        # Extract points from the scene
-        points = self.scene['points']
+    def point_arrays(self):
+        """
+        :return: dict
+            The points of the scene in columnar form (converted once for scenes keyed by id).
+        """
+        if self._point_arrays is None:
+            points = self.scene['points']
+            self._point_arrays = points if is_columnar(points) else points3D_to_columnar(points)
+        return self._point_arrays
 
-        # Convert point positions to numpy array if it is not already
-        xyz = np.array([point['xyz'] for point in points.values()])
+    def create_cells(self, bounding_box=None):
+        """
+        Creates a grid of cells based on the bounding box of 3D point positions.
 
-        # Get the minimum X and Z
-        min_x = np.min(xyz[:, 0])  # Minimum value of the first column (X)
-        min_z = np.min(xyz[:, 2])  # Minimum value of the third column (Z)
+        In adaptive mode the grid is refined into a quadtree instead; self.cells then is a dictionary keyed by
+        (row, col) of each leaf's top-left corner on the finest grid (rows * 2 ** max_depth by
+        cols * 2 ** max_depth), so keys stay unique and compatible with the cell boundaries file.
 
-        # Get the maximum X and Z
-        max_x = np.max(xyz[:, 0])  # Maximum value of the first column (X)
-        max_z = np.max(xyz[:, 2])  # Maximum value of the third column (Z)
+        :param bounding_box: dict
+            The 'min' and 'max' [x, z] points of the bounding box, when already known (e.g., when the points are
+            read in batches). Computed from the scene's points otherwise.
+        """
+        if bounding_box is None:
+            # Extract points from the scene
+            xyz = self.point_arrays()['xyz']
 
-        # Define the bounding box
-        bounding_box = {
-            "min": [min_x, min_z],  # Minimum X and Z values
-            "max": [max_x, max_z]  # Maximum X and Z values
-        }
+            # Get the minimum X and Z
+            min_x = np.min(xyz[:, 0])  # Minimum value of the first column (X)
+            min_z = np.min(xyz[:, 2])  # Minimum value of the third column (Z)
+
+            # Get the maximum X and Z
+            max_x = np.max(xyz[:, 0])  # Maximum value of the first column (X)
+            max_z = np.max(xyz[:, 2])  # Maximum value of the third column (Z)
+
+            # Define the bounding box
+            bounding_box = {
+                "min": [min_x, min_z],  # Minimum X and Z values
+                "max": [max_x, max_z]  # Maximum X and Z values
+            }
+
+        # Number of rows and columns of the finest grid
+        depth = self.max_depth if self.adaptive else 0
+        fine_rows = self.rows << depth
+        fine_cols = self.cols << depth
 
         # Compute size of each cell
-        col_size = (bounding_box['max'][0] - bounding_box['min'][0]) / self.cols
-        row_size = (bounding_box['max'][1] - bounding_box['min'][1]) / self.rows
+        col_size = (bounding_box['max'][0] - bounding_box['min'][0]) / fine_cols
+        row_size = (bounding_box['max'][1] - bounding_box['min'][1]) / fine_rows
+
+        # Cell edges along X (ascending, one per column boundary) and Z (descending, one per row boundary)
+        self.x_edges = np.array([bounding_box['min'][0] + col_size * col for col in range(fine_cols + 1)])
+        self.z_edges = np.array([bounding_box['max'][1] - row_size * row for row in range(fine_rows + 1)])
+
+        if self.adaptive:
+            self._create_adaptive_cells(self.point_arrays()['xyz'], fine_rows, fine_cols)
+            return
 
         # Divide bounding box into rows * cols cells
         for row in range(self.rows):
@@ -59,93 +146,431 @@ class SceneSplitter:
                     "max": [bounding_box['min'][0] + col_size * (col + 1), bounding_box['max'][1] - row_size * row]
                 }
 
+        self.cell_keys = [(row, col) for row in range(self.rows) for col in range(self.cols)]
+        self.cell_lookup = np.arange(self.rows * self.cols)
+        self._build_cell_index()
+
+    def _create_adaptive_cells(self, xyz, fine_rows: int, fine_cols: int):
+        """
+        Builds the quadtree cells of adaptive mode on top of the finest grid edges.
+
+        :param xyz: numpy.ndarray
+            The point coordinates.
+        :param fine_rows: int
+            Number of rows of the finest grid.
+        :param fine_cols: int
+            Number of columns of the finest grid.
+        """
+        point_arrays = self.point_arrays()
+        track_offsets = point_arrays['track_offsets']
+        track_image_ids = point_arrays['track_image_ids']
+
+        # Position of every point on the finest grid
+        fine_cells = self._assign_fine_cells(xyz[:, 0], xyz[:, 2], fine_rows, fine_cols)
+        inside = np.flatnonzero(fine_cells >= 0)
+        point_rows = fine_cells[inside] // fine_cols
+        point_cols = fine_cells[inside] % fine_cols
+
+        def fits(indices):
+            if self.max_points is not None and len(indices) > self.max_points:
+                return False
+            if self.max_cameras is not None:
+                elements, _ = take_ragged(track_offsets, indices)
+                if len(np.unique(track_image_ids[elements])) > self.max_cameras:
+                    return False
+            return True
+
+        # Subdivide every grid cell until its points and cameras fit the budgets
+        leaves = []
+        size = 1 << self.max_depth
+        stack = [(row * size, col * size, size,
+                  np.flatnonzero((point_rows // size == row) & (point_cols // size == col)))
+                 for row in range(self.rows) for col in range(self.cols)]
+        while stack:
+            row0, col0, node_size, members = stack.pop()
+            if len(members) == 0:
+                continue
+            if node_size == 1 or fits(inside[members]):
+                leaves.append((row0, col0, node_size))
+                continue
+
+            half = node_size // 2
+            lower_row = point_rows[members] < row0 + half
+            lower_col = point_cols[members] < col0 + half
+            stack.append((row0, col0, half, members[lower_row & lower_col]))
+            stack.append((row0, col0 + half, half, members[lower_row & ~lower_col]))
+            stack.append((row0 + half, col0, half, members[~lower_row & lower_col]))
+            stack.append((row0 + half, col0 + half, half, members[~lower_row & ~lower_col]))
+
+        # Leaves are kept in row-major order of their top-left corner
+        leaves.sort()
+        self.cells = {}
+        self.cell_keys = []
+        self.cell_lookup = np.full(fine_rows * fine_cols, -1, dtype=np.int64)
+        for idx, (row0, col0, node_size) in enumerate(leaves):
+            self.cells[(row0, col0)] = {
+                "min": [self.x_edges[col0], self.z_edges[row0 + node_size]],
+                "max": [self.x_edges[col0 + node_size], self.z_edges[row0]]
+            }
+            self.cell_keys.append((row0, col0))
+            self.cell_lookup.reshape(fine_rows, fine_cols)[row0:row0 + node_size, col0:col0 + node_size] = idx
+        self._build_cell_index()
+
+        print(f"Adaptive split: {len(leaves)} cells")
+
     def split_scene(self):
         """
         Splits the scene into grid cells and classifies points into these cells,
         also aggregates cameras that sees the points within each cell.
+
+        :return: tuple
+            The cells (a rows x cols grid, or a dictionary keyed by position in adaptive mode) and the list of
+            ((row, col), cell scene) pairs of the relevant cells.
         """
-        # Generate cells
-        self.create_cells()
-
-        # Extract points and cameras from the scene
-        points = self.scene['points']
-        cameras = self.scene['cameras']
-
-        # Define cell points and cameras matrices
-        cell_points = {(r, c): {} for r in range(self.rows) for c in range(self.cols)}
-        cell_cameras = {(r, c): {} for r in range(self.rows) for c in range(self.cols)}
-
-        cell_camera_freq = {(r, c): defaultdict(int) for r in range(self.rows) for c in range(self.cols)}
-
-        id_error_count = 0  # ID correlation error count
-
-        step = 0
-        for point_id, point in points.items():
-            # Log steps
-            step = step + 1
-            print(f"Splitting scene: {round(float(step / self.num_of_points) * 100.0, 2)}%")
-
-            # Extract ground plane (XZ axis) 2D coordinates
-            x, z = point['xyz'][0], point['xyz'][2]
-
-            # Find the cell the point belongs to
-            for row in range(self.rows):
-                found_cell = False
-                for col in range(self.cols):
-                    cell = self.cells[row][col]
-                    if cell['min'][0] <= x < cell['max'][0] and cell['min'][1] <= z < cell['max'][1]:
-                        # Append point to the appropiate cell (use point_id as key)
-                        cell_points[(row, col)][point_id] = point
-
-                        # Append cameras in which the point is seen
-                        for pt_image_id, _ in point['track']:
-                            if pt_image_id in cameras.keys():
-                                cell_cameras[(row, col)][pt_image_id] = cameras[pt_image_id]
-                                # Initialize or increment frequency
-                                if pt_image_id in cell_camera_freq[(row, col)]:
-                                    cell_camera_freq[(row, col)][pt_image_id] += 1
-                                else:
-                                    cell_camera_freq[(row, col)][pt_image_id] = 1
-                            else:
-                                id_error_count = id_error_count + 1
-
-                        # Found the cell, no need to check other cells
-                        found_cell = True
-                        break
-
-                if found_cell:
-                    break
-
-        # Convert cell data to the same format as the scene
-        split_scenes = []
-        for row in range(self.rows):
-            for col in range(self.cols):
-                cell_num_cameras = len(cell_cameras[(row, col)])
-                cell_num_points = len(cell_points[(row, col)])
+        with stage('split'):
+            # Generate cells
+            with stage('cells'):
+                self.create_cells()
+
+            # Extract points and cameras from the scene
+            points = self.scene['points']
+            cameras = self.scene['cameras']
+            columnar_points = is_columnar(points)
+            columnar_cameras = is_columnar(cameras)
+
+            # Work on flat arrays regardless of the scene representation
+            point_arrays = self.point_arrays()
+            if columnar_cameras:
+                camera_ids = cameras['ids'].astype(np.int64)
+            else:
+                camera_ids = np.array(list(cameras.keys()), dtype=np.int64)
+
+            print(f"Splitting scene: {self.num_of_points} points into {len(self.cell_keys)} cells")
+
+            # Find the (point, cell) memberships, ordered by point: one per point without a margin, one per nearby cell
+            # with a margin
+            member_points, member_cells = self.cell_memberships(point_arrays['xyz'][:, 0], point_arrays['xyz'][:, 2])
+            num_cells = len(self.cell_keys)
+
+            # Group point rows by cell, preserving the scene order within each cell
+            order = member_points[np.argsort(member_cells, kind='stable')]
+            cell_num_points = np.bincount(member_cells, minlength=num_cells)
+            cell_point_offsets = np.concatenate(([0], np.cumsum(cell_num_points)))
 
-                # Prune insignificant cameras
-                cameras_to_remove = [image_id for image_id, freq in cell_camera_freq[(row, col)].items()
-                                     if freq / cell_num_points < 0.003]
-                for image_id in cameras_to_remove:
-                    del cell_cameras[(row, col)][image_id]
+            # Build the sparse (cell, camera) histogram over the flattened tracks of the binned points
+            camera_order = np.argsort(camera_ids, kind='stable')
+            pair_keys, id_error_count = self._camera_pairs(point_arrays, member_points, member_cells, camera_ids,
+                                                           camera_order)
+            pairs, first_seen, frequencies = np.unique(pair_keys, return_index=True, return_counts=True)
+            cell_num_cameras, kept_cameras, cell_camera_offsets = self._select_cameras(
+                pairs, first_seen, frequencies, cell_num_points, max(len(camera_ids), 1))
+
+            # Convert cell data to the same format as the scene
+            point_keys = None if columnar_points else list(points.keys())
+            camera_keys = None if columnar_cameras else camera_ids.tolist()
+            split_scenes = []
+            for cell_idx, (row, col) in enumerate(self.cell_keys):
+                progress('Building cell scenes', cell_idx + 1, num_cells)
+                point_rows = order[cell_point_offsets[cell_idx]:cell_point_offsets[cell_idx + 1]]
+                camera_rows = kept_cameras[cell_camera_offsets[cell_idx]:cell_camera_offsets[cell_idx + 1]]
+                num_points = int(cell_num_points[cell_idx])
 
                 # Check if cell is empty or irrelevant
-                if not cell_cameras[(row, col)]:
-                    print(f"WARNING: Cell scene at the ({row}, {col}) position is empty!")
+                if not self._is_relevant((row, col), len(camera_rows), int(cell_num_cameras[cell_idx]), num_points):
                     continue
-                elif cell_num_cameras / cell_num_points > 0.5 or cell_num_points < 10:
-                    print(f"WARNING: Cell scene at the ({row}, {col}) position is irrelevant!")
+
+                # Cells of a Scene are views holding only their row positions into the parent arrays
+                if isinstance(self.scene, Scene):
+                    split_scenes.append(((row, col), self.scene.view(point_rows, camera_rows)))
                     continue
 
+                if columnar_points:
+                    cell_points = take_points(points, point_rows)
+                else:
+                    cell_points = {point_keys[i]: points[point_keys[i]] for i in point_rows.tolist()}
+
+                if columnar_cameras:
+                    cell_cameras = take_images(cameras, camera_rows)
+                else:
+                    cell_cameras = {camera_keys[i]: cameras[camera_keys[i]] for i in camera_rows.tolist()}
+
                 cell_scene = {
-                    'points': cell_points[(row, col)],
-                    'cameras': cell_cameras[(row, col)]
+                    'points': cell_points,
+                    'cameras': cell_cameras
                 }
 
                 split_scenes.append(((row, col), cell_scene))
 
-        # Log the ID correlation error count
-        if id_error_count > 0:
-            print(f"WARNING: {id_error_count} image IDs extracted from points do not match cameras' image IDs!")
+            # Log the ID correlation error count
+            if id_error_count > 0:
+                print(f"WARNING: {id_error_count} image IDs extracted from points do not match cameras' image IDs!")
 
         return self.cells, split_scenes
+
+    def split_stream(self, point_batches, cameras, shards=None):
+        """
+        Splits a scene whose points are read in batches (see COLMAPLoader.iter_points3D), without ever holding all of
+        them: a first pass over the batches finds the bounding box of the grid, a second one bins every batch into
+        cells and accumulates the (cell, camera) observation frequencies. Only the cells' point positions and the
+        histogram outlive a batch. In spill mode, the binned points of every batch are appended to the cells' shards
+        on disk instead, so the cells can be exported one at a time afterwards.
+
+        The cells, points and cameras are the same as those split_scene finds for the complete scene. Adaptive
+        splitting needs every point at once and is not supported.
+
+        :param point_batches: callable
+            Returns a new iterator over the batches of points, in the same order every time (e.g.,
+            functools.partial(loader.iter_points3D, batch_size)). It is called twice.
+        :param cameras: dict
+            The columnar images of the scene (see COLMAPLoader.load_images_columnar); only their ids are used.
+        :param shards: CellShards
+            Enables spill mode: the shards the binned points are appended to.
+        :return: tuple
+            The rows x cols grid of cells and the list of ((row, col), point rows, camera rows) triples of the
+            relevant cells, where point rows are positions of the cell's points in the batches' order (None in spill
+            mode) and camera rows index the cameras.
+        """
+        if self.adaptive:
+            raise ValueError("Adaptive splitting needs every point at once; split the complete scene instead")
+
+        with stage('split'):
+            # Find the bounding box of the points
+            with stage('bounds'):
+                low = np.full(2, np.inf)
+                high = np.full(2, -np.inf)
+                self.num_of_points = 0
+                for batch in point_batches():
+                    if len(batch['ids']) == 0:
+                        continue
+                    ground = batch['xyz'][:, [0, 2]]
+                    low = np.minimum(low, ground.min(axis=0))
+                    high = np.maximum(high, ground.max(axis=0))
+                    self.num_of_points += len(batch['ids'])
+
+            # Generate cells
+            with stage('cells'):
+                self.create_cells({"min": [low[0], low[1]], "max": [high[0], high[1]]})
+
+            print(f"Splitting scene: {self.num_of_points} points into {len(self.cell_keys)} cells (streamed)")
+
+            camera_ids = np.asarray(cameras['ids']).astype(np.int64)
+            camera_order = np.argsort(camera_ids, kind='stable')
+            num_cells = len(self.cell_keys)
+            num_cameras = max(len(camera_ids), 1)
+
+            # Bin every batch, accumulating the cells' point positions and the (cell, camera) histogram
+            with stage('bin'):
+                cell_num_points = np.zeros(num_cells, dtype=np.int64)
+                member_rows, member_cell_parts = [], []
+                pairs = np.empty(0, dtype=np.int64)
+                first_seen = np.empty(0, dtype=np.int64)
+                frequencies = np.empty(0, dtype=np.int64)
+                id_error_count = 0
+                first_row = 0
+                first_pair = 0
+                for batch in point_batches():
+                    member_points, member_cells = self.cell_memberships(batch['xyz'][:, 0], batch['xyz'][:, 2])
+                    if shards is not None:
+                        shards.append_batch(batch, member_points, member_cells, self.cell_keys)
+                    else:
+                        member_rows.append(member_points + first_row)
+                        member_cell_parts.append(member_cells)
+                    cell_num_points += np.bincount(member_cells, minlength=num_cells)
+
+                    pair_keys, batch_errors = self._camera_pairs(batch, member_points, member_cells, camera_ids,
+                                                                 camera_order)
+                    batch_pairs, batch_first, batch_frequencies = np.unique(pair_keys, return_index=True,
+                                                                            return_counts=True)
+                    pairs, first_seen, frequencies = _merge_histograms(
+                        (pairs, first_seen, frequencies), (batch_pairs, batch_first + first_pair, batch_frequencies))
+                    id_error_count += batch_errors
+                    first_row += len(batch['ids'])
+                    first_pair += len(pair_keys)
+                    progress('Binning points', first_row, self.num_of_points)
+
+            # Group point positions by cell, preserving the scene order within each cell
+            member_points = np.concatenate(member_rows) if member_rows else np.empty(0, dtype=np.int64)
+            member_cells = np.concatenate(member_cell_parts) if member_cell_parts else np.empty(0, dtype=np.int64)
+            order = member_points[np.argsort(member_cells, kind='stable')]
+            cell_point_offsets = np.concatenate(([0], np.cumsum(cell_num_points)))
+
+            cell_num_cameras, kept_cameras, cell_camera_offsets = self._select_cameras(
+                pairs, first_seen, frequencies, cell_num_points, num_cameras)
+
+            split_cells = []
+            for cell_idx, (row, col) in enumerate(self.cell_keys):
+                point_rows = None if shards is not None else \
+                    order[cell_point_offsets[cell_idx]:cell_point_offsets[cell_idx + 1]]
+                camera_rows = kept_cameras[cell_camera_offsets[cell_idx]:cell_camera_offsets[cell_idx + 1]]
+                if self._is_relevant((row, col), len(camera_rows), int(cell_num_cameras[cell_idx]),
+                                     int(cell_num_points[cell_idx])):
+                    split_cells.append(((row, col), point_rows, camera_rows))
+
+            # Log the ID correlation error count
+            if id_error_count > 0:
+                print(f"WARNING: {id_error_count} image IDs extracted from points do not match cameras' image IDs!")
+
+        return self.cells, split_cells
+
+    @staticmethod
+    def _camera_pairs(points, member_points, member_cells, camera_ids, camera_order):
+        """
+        Maps the track elements of binned points to (cell, camera) pair keys.
+
+        :param points: dict
+            Columnar points (a complete scene or a batch).
+        :param member_points: numpy.ndarray
+            Point rows of the memberships (see cell_memberships).
+        :param member_cells: numpy.ndarray
+            Cell indices of the memberships.
+        :param camera_ids: numpy.ndarray
+            The cameras' image_ids.
+        :param camera_order: numpy.ndarray
+            The stable argsort of camera_ids.
+        :return: tuple
+            The pair keys (cell * number of cameras + camera row) of the track elements whose image_id matches a
+            camera, in membership order, and the number of track elements matching no camera.
+        """
+        track_elements, member_track_offsets = take_ragged(points['track_offsets'], member_points)
+        track_cells = np.repeat(member_cells, np.diff(member_track_offsets))
+        track_image_ids = points['track_image_ids'][track_elements].astype(np.int64)
+
+        # Match track image_ids against the cameras' image_ids
+        sorted_camera_ids = camera_ids[camera_order]
+        positions = np.searchsorted(sorted_camera_ids, track_image_ids)
+        positions[positions == len(sorted_camera_ids)] = 0
+        matched = sorted_camera_ids[positions] == track_image_ids if len(sorted_camera_ids) else \
+            np.zeros(len(track_image_ids), dtype=bool)
+        id_error_count = int(np.count_nonzero(~matched))  # ID correlation error count
+
+        num_cameras = max(len(camera_ids), 1)
+        return track_cells[matched] * num_cameras + camera_order[positions[matched]], id_error_count
+
+    def _select_cameras(self, pairs, first_seen, frequencies, cell_num_points, num_cameras: int):
+        """
+        Selects the cameras of every cell from the (cell, camera) histogram, pruning those with a low visibility
+        score.
+
+        :param pairs: numpy.ndarray
+            The sorted unique pair keys (see _camera_pairs).
+        :param first_seen: numpy.ndarray
+            Position of the first observation of every pair.
+        :param frequencies: numpy.ndarray
+            Number of observations of every pair.
+        :param cell_num_points: numpy.ndarray
+            Number of points of every cell.
+        :param num_cameras: int
+            The number of cameras the pair keys were built with.
+        :return: tuple
+            The number of cameras observing every cell before pruning, the kept camera rows grouped by cell (ordered by
+            first observation) and the offsets of every cell's group.
+        """
+        num_cells = len(cell_num_points)
+        pair_cells = pairs // num_cameras
+        pair_cameras = pairs % num_cameras
+        cell_num_cameras = np.bincount(pair_cells, minlength=num_cells)
+
+        # Prune cameras with a low visibility score
+        kept = frequencies / np.maximum(cell_num_points[pair_cells], 1) >= self.camera_visibility
+
+        # Order the remaining cameras of each cell by their first observation
+        kept_order = np.lexsort((first_seen[kept], pair_cells[kept]))
+        kept_cells = pair_cells[kept][kept_order]
+        kept_cameras = pair_cameras[kept][kept_order]
+        cell_camera_offsets = np.concatenate(([0], np.cumsum(np.bincount(kept_cells, minlength=num_cells))))
+        return cell_num_cameras, kept_cameras, cell_camera_offsets
+
+    @staticmethod
+    def _is_relevant(grid_pos, num_kept_cameras: int, num_cameras: int, num_points: int):
+        """
+        Checks whether a cell is worth exporting, warning about empty and irrelevant cells.
+
+        :return: bool
+        """
+        row, col = grid_pos
+        if num_kept_cameras == 0:
+            print(f"WARNING: Cell scene at the ({row}, {col}) position is empty!")
+            return False
+        elif num_cameras / num_points > 0.5 or num_points < 10:
+            print(f"WARNING: Cell scene at the ({row}, {col}) position is irrelevant!")
+            return False
+        return True
+
+    def _build_cell_index(self):
+        """
+        Builds the CellIndex of the cells directly from the finest grid, whose cells are its atoms.
+        """
+        fine_rows = len(self.z_edges) - 1
+        fine_cols = len(self.x_edges) - 1
+
+        # The index expects ascending Z edges, so the finest grid rows are flipped
+        atom_cells = self.cell_lookup.reshape(fine_rows, fine_cols)[::-1]
+        self.cell_index = CellIndex(self.x_edges, self.z_edges[::-1], atom_cells, self.cell_keys)
+
+    def assign_cells(self, x, z):
+        """
+        Finds the cell containing each of the given ground plane coordinates.
+
+        A coordinate belongs to the cell whose [min, max) range contains it on both axes, exactly as defined by the
+        cell boundaries built in create_cells.
+
+        :param x: numpy.ndarray
+            X coordinates.
+        :param z: numpy.ndarray
+            Z coordinates.
+        :return: numpy.ndarray
+            Indices into self.cell_keys (row * cols + col on a uniform grid), or -1 for coordinates outside every cell.
+        """
+        return self.cell_index.locate(x, z)
+
+    def cell_memberships(self, x, z):
+        """
+        Finds every cell each of the given ground plane coordinates belongs to, buffer zones included.
+
+        Without a margin this is the single cell found by assign_cells; with a margin, every cell within the margin on
+        both axes (see CellIndex.locate_within).
+
+        :param x: numpy.ndarray
+            X coordinates.
+        :param z: numpy.ndarray
+            Z coordinates.
+        :return: tuple
+            Arrays of point indices and cell indices (into self.cell_keys) of every membership, ordered by point and
+            then by cell.
+        """
+        return self.cell_index.locate_within(x, z, self.margin)
+
+    def _assign_fine_cells(self, x, z, fine_rows: int, fine_cols: int):
+        """
+        Finds the cell of the finest grid containing each of the given ground plane coordinates.
+
+        :return: numpy.ndarray
+            Flat finest-grid indices (row * fine_cols + col), or -1 for coordinates outside the grid.
+        """
+        col = np.searchsorted(self.x_edges, x, side='right') - 1
+        flipped_row = np.searchsorted(self.z_edges[::-1], z, side='right') - 1
+        row = fine_rows - 1 - flipped_row
+
+        inside = (col >= 0) & (col < fine_cols) & (flipped_row >= 0) & (flipped_row < fine_rows)
+        return np.where(inside, row * fine_cols + col, -1)
+
+
+def _merge_histograms(first, second):
+    """
+    Merges two sparse (cell, camera) histograms.
+
+    :param first: tuple
+        Sorted unique pair keys, first observation positions and frequencies.
+    :param second: tuple
+        Likewise.
+    :return: tuple
+        The merged pair keys, earliest first observation positions and summed frequencies.
+    """
+    pairs = np.concatenate((first[0], second[0]))
+    merged_pairs, inverse = np.unique(pairs, return_inverse=True)
+
+    first_seen = np.full(len(merged_pairs), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first_seen, inverse, np.concatenate((first[1], second[1])))
+    frequencies = np.zeros(len(merged_pairs), dtype=np.int64)
+    np.add.at(frequencies, inverse, np.concatenate((first[2], second[2])))
+    return merged_pairs, first_seen, frequencies